@@ -0,0 +1,122 @@
+import time
+from datetime import datetime, timedelta, timezone
+from zoneinfo import ZoneInfo
+
+SCHEMA_VERSION_EPOCH = 1
+
+# Колонки со временем: таблица -> колонки, которые переводятся в секунды Unix (UTC)
+MAIN_EPOCH_COLUMNS = {
+    'users': ('join_date', 'last_activity'),
+    'commands_log': ('executed_at',),
+}
+SHARD_EPOCH_COLUMNS = {
+    'posts': ('post_date',),
+}
+
+MAIN_INDEXES = (
+    "CREATE INDEX IF NOT EXISTS idx_commands_log_executed_at ON commands_log(executed_at)",
+    "CREATE INDEX IF NOT EXISTS idx_users_join_date ON users(join_date)",
+    "CREATE INDEX IF NOT EXISTS idx_users_last_activity ON users(last_activity)",
+)
+SHARD_INDEXES = (
+    "CREATE INDEX IF NOT EXISTS idx_posts_channel_date ON posts(channel_id, post_date)",
+)
+
+BUCKET_UNITS = {
+    'day': (timedelta(days=1), 7, 90),    # шаг, значение по умолчанию, максимум
+    'hour': (timedelta(hours=1), 24, 168),
+}
+
+
+def now_ts():
+    return int(time.time())
+
+
+def _migrate(conn, columns, indexes):
+    """Текстовые даты (CURRENT_TIMESTAMP, datetime, isoformat) → секунды Unix.
+
+    Старые значения без зоны считаются UTC: CURRENT_TIMESTAMP пишется в
+    UTC, а сервер на Render работает в UTC.
+    """
+    version = conn.execute("PRAGMA user_version").fetchone()[0]
+    if version >= SCHEMA_VERSION_EPOCH:
+        return False
+    with conn:
+        for table, table_columns in columns.items():
+            for column in table_columns:
+                conn.execute(f'''
+                    UPDATE {table}
+                    SET {column} = CAST(strftime('%s', {column}) AS INTEGER)
+                    WHERE typeof({column}) = 'text'
+                ''')
+        for sql in indexes:
+            conn.execute(sql)
+        conn.execute(f"PRAGMA user_version = {SCHEMA_VERSION_EPOCH}")
+    return True
+
+
+def migrate_main(conn):
+    return _migrate(conn, MAIN_EPOCH_COLUMNS, MAIN_INDEXES)
+
+
+def migrate_shard(conn):
+    return _migrate(conn, SHARD_EPOCH_COLUMNS, SHARD_INDEXES)
+
+
+def get_timezone(name):
+    if not name or name.upper() == 'UTC':
+        return timezone.utc
+    return ZoneInfo(name)
+
+
+def format_ts(ts, tz, fmt='%Y-%m-%d %H:%M'):
+    if ts is None:
+        return None
+    return datetime.fromtimestamp(int(ts), tz).strftime(fmt)
+
+
+def bucket_bounds(unit, count, tz, now=None):
+    """Границы count последних интервалов (день/час) в локальном времени tz.
+
+    Возвращает [(начало, конец)] в секундах Unix, от старых к новым.
+    Сутки считаются от локальной полуночи, поэтому при переходе на
+    летнее время день может длиться 23 или 25 часов.
+    """
+    step = BUCKET_UNITS[unit][0]
+    local_now = datetime.fromtimestamp(now_ts() if now is None else now, tz)
+    if unit == 'day':
+        start = local_now.replace(hour=0, minute=0, second=0, microsecond=0)
+    else:
+        start = local_now.replace(minute=0, second=0, microsecond=0)
+
+    bounds = []
+    for i in range(count):
+        if unit == 'day':
+            # Полночь через календарную дату, а не через 24 часа
+            begin_date = start.date() - timedelta(days=i)
+            begin = datetime(begin_date.year, begin_date.month, begin_date.day, tzinfo=tz)
+            end_date = begin_date + timedelta(days=1)
+            end = datetime(end_date.year, end_date.month, end_date.day, tzinfo=tz)
+        else:
+            # Часы считаются в UTC: арифметика с aware-datetime идет по «настенному» времени
+            begin = start.astimezone(timezone.utc) - step * i
+            end = begin + step
+        bounds.append((int(begin.timestamp()), int(end.timestamp())))
+    bounds.reverse()
+    return bounds
+
+
+def histogram(conn, table, column, bounds):
+    """[(начало, количество)] — по одному поиску диапазона в индексе на интервал"""
+    if not bounds:
+        return []
+    values = ', '.join(['(?, ?)'] * len(bounds))
+    rows = conn.execute(f'''
+        WITH buckets(bucket_start, bucket_end) AS (VALUES {values})
+        SELECT bucket_start,
+               (SELECT COUNT(*) FROM {table}
+                WHERE {column} >= bucket_start AND {column} < bucket_end)
+        FROM buckets
+        ORDER BY bucket_start
+    ''', [value for bound in bounds for value in bound]).fetchall()
+    return [(row[0], row[1]) for row in rows]
@@ -1,21 +1,42 @@
 import os
 import telebot
+from telebot.handler_backends import BaseMiddleware, CancelUpdate
 from flask import Flask, request, jsonify
 import sqlite3
 import json
-from datetime import datetime, timedelta
+from datetime import datetime
 import threading
 import time
 import logging
 import random
 import traceback
+import io
+import atexit
+from concurrent.futures import ThreadPoolExecutor
+
+from flood_control import FloodControl
+from log_pipeline import LoggingPipeline, bind, log_context, reset_log_context
+from storage import MAIN_SCHEMA, ShardCountMismatch, ShardedPostStorage
+from trending import TrendingTracker
+from activity import BUCKET_UNITS, bucket_bounds, format_ts, get_timezone, histogram, migrate_main, migrate_shard, now_ts
+from backup import DatabaseBackup
+from broadcast import BroadcastEngine, init_broadcast_tables
+from pagination import ResultCursors, page_count, page_slice
+from ingest import CHANNEL_UPDATE_KEYS, ChannelPostIngestor, update_kind
+from profiler import MAX_PROFILE_SECONDS, MemoryProfiler, RequestProfiler
+from reports import ReportCache, ReportRenderer, charts_available, render_reactions_chart, render_views_chart
 
 # ========== НАСТРОЙКА ЛОГГИРОВАНИЯ ==========
-logging.basicConfig(
-    level=logging.INFO,
-    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
-)
+# Логи пишутся JSON-строками в фоновом потоке; сырые тела вебхука — выборочно
+log_pipeline = LoggingPipeline(
+    level=os.environ.get('LOG_LEVEL', 'INFO'),
+    queue_size=int(os.environ.get('LOG_QUEUE_SIZE', 10000)),
+    sample_rate=float(os.environ.get('LOG_RAW_SAMPLE_RATE', 0.01)),
+    sampled_loggers=('webhook.raw',)
+).start()
+atexit.register(log_pipeline.stop)
 logger = logging.getLogger(__name__)
+raw_logger = logging.getLogger('webhook.raw')
 
 # ========== КОНФИГУРАЦИЯ ==========
 BOT_TOKEN = "8519907445:AAGQKcnBDHoCsc3exLB7BjQpk3281SeIdHc"
@@ -23,12 +44,133 @@ ADMIN_IDS = [1851663626]
 BOT_USERNAME = "Goononkhamun_bot"
 BOT_LINK = f"https://t.me/{BOT_USERNAME}"
 
+# Лимиты запросов: (запросов, за_секунд)
+FLOOD_USER_LIMIT = (20, 60)
+FLOOD_COMMAND_LIMITS = {
+    '/test': (2, 300),
+    '/stats': (5, 60),
+    '/top': (10, 60),
+    '/channels': (10, 60),
+    '/trending': (10, 60),
+    '/report': (3, 60),
+    '/activity': (10, 60),
+    'callback': (30, 60),
+}
+
+# Профилирование по команде администратора (по умолчанию выключено)
+request_profiler = RequestProfiler()
+memory_profiler = MemoryProfiler()
+
 # Инициализация бота и Flask
-bot = telebot.TeleBot(BOT_TOKEN, threaded=False)  # Отключаем многопоточность для вебхука
+bot = telebot.TeleBot(BOT_TOKEN, threaded=False, use_class_middlewares=True)  # Отключаем многопоточность для вебхука
 app = Flask(__name__)
 
+# ========== ЗАЩИТА ОТ ФЛУДА ==========
+flood_control = FloodControl(
+    user_limit=FLOOD_USER_LIMIT,
+    command_limits=FLOOD_COMMAND_LIMITS,
+    exempt_ids=ADMIN_IDS,
+)
+
+FLOOD_WARNING = "⏳ Слишком много запросов, попробуйте позже"
+
+def check_flood(message):
+    """None — пропустить; 'callback' / 'reply' / 'drop' — отбросить и как предупредить"""
+    user = message.from_user
+    if user is None:
+        return None
+
+    is_callback = isinstance(message, telebot.types.CallbackQuery)
+    command = None
+    if is_callback:
+        command = 'callback'
+    elif message.text and message.text.startswith('/'):
+        command = message.text.split()[0].split('@')[0].lower()
+
+    if flood_control.check(user.id, command):
+        return None
+    if is_callback:
+        return 'callback'
+    return 'reply' if flood_control.should_notify(user.id) else 'drop'
+
+class FloodControlMiddleware(BaseMiddleware):
+    """Отбрасывает сообщения и нажатия кнопок сверх лимита до обработчиков и обращений к БД"""
+
+    def __init__(self):
+        super().__init__()
+        self.update_types = ['message', 'callback_query']
+
+    def pre_process(self, message, data):
+        verdict = check_flood(message)
+        if verdict is None:
+            return None
+
+        if verdict == 'callback':
+            try:
+                bot.answer_callback_query(message.id, FLOOD_WARNING)
+            except Exception as e:
+                logger.warning(f"Не удалось ответить на нажатие кнопки: {e}")
+        elif verdict == 'reply':
+            try:
+                bot.reply_to(message, FLOOD_WARNING)
+            except Exception as e:
+                logger.warning(f"Не удалось отправить предупреждение о флуде: {e}")
+        return CancelUpdate()
+
+    def post_process(self, message, data, exception=None):
+        pass
+
+bot.setup_middleware(FloodControlMiddleware())
+
 # ========== БАЗА ДАННЫХ ==========
-DB_PATH = '/tmp/bot_database.db' if 'RENDER' in os.environ else 'bot_database.db'
+DB_PATH = os.environ.get('DB_PATH') or ('/tmp/bot_database.db' if 'RENDER' in os.environ else 'bot_database.db')
+POST_SHARDS = int(os.environ.get('POST_SHARDS', 4))
+
+# Время хранится в секундах Unix (UTC), часовой пояс — только для отображения и группировки
+BOT_TIMEZONE = os.environ.get('BOT_TIMEZONE', 'UTC')
+BOT_TZ = get_timezone(BOT_TIMEZONE)
+
+# Посты лежат в отдельных файлах-шардах, users/channels/commands_log — в DB_PATH
+post_storage = ShardedPostStorage(DB_PATH, POST_SHARDS)
+
+# Типы обновлений, которые бот обрабатывает; остальные отбрасываются до Update.de_json
+HANDLED_UPDATE_KEYS = ('message', 'callback_query') + CHANNEL_UPDATE_KEYS
+
+# Постраничный вывод: отсортированные id результата кэшируются на время TTL
+PAGE_SIZE = 10
+TOP_MAX = 100
+CHANNELS_MAX = 1000
+result_cursors = ResultCursors(ttl=600, max_entries=1000)
+
+# Рассылка: общий лимит Telegram ~30 сообщений/сек на бота
+BROADCAST_RATE = 25
+BROADCAST_CONCURRENCY = 8
+
+# Резервные копии в постоянный каталог (на Render /tmp очищается при деплое)
+BACKUP_DIR = os.environ.get('BACKUP_DIR', 'data/backups')
+BACKUP_INTERVAL = int(os.environ.get('BACKUP_INTERVAL', 600))
+BACKUP_KEEP = int(os.environ.get('BACKUP_KEEP', 5))
+database_backup = DatabaseBackup([DB_PATH] + post_storage.paths, BACKUP_DIR, keep=BACKUP_KEEP)
+
+# Скорость набора просмотров, обновляется при каждой записи метрик постов
+trending = TrendingTracker(capacity=10000, tau=3600)
+TRENDING_SAVE_INTERVAL = 60
+
+# Графики рендерятся в пуле процессов, готовые картинки кэшируются
+report_cache = ReportCache(max_entries=256)
+report_renderer = ReportRenderer(report_cache, max_workers=2)
+# Загрузка картинок в Telegram — не в потоке результатов пула процессов
+report_sender = ThreadPoolExecutor(max_workers=2, thread_name_prefix='report-send')
+
+# Посты каналов, где бот — администратор, приходят прямо в вебхук
+channel_ingestor = ChannelPostIngestor(
+    lambda: get_db_connection(),
+    post_storage,
+    batch_size=200,
+    flush_interval=2.0,
+    on_flush=report_cache.bump
+)
+dropped_updates = 0
 
 def init_database():
     """Инициализация базы данных"""
@@ -36,56 +178,42 @@ def init_database():
         conn = sqlite3.connect(DB_PATH)
         cursor = conn.cursor()
         
-        cursor.execute('''
-            CREATE TABLE IF NOT EXISTS users (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                user_id INTEGER UNIQUE NOT NULL,
-                username TEXT,
-                first_name TEXT,
-                join_date TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                last_activity TIMESTAMP
-            )
-        ''')
+        # WAL: писатели не ждут читателей, в том числе онлайн-бэкап
+        cursor.execute("PRAGMA journal_mode=WAL")
         
-        cursor.execute('''
-            CREATE TABLE IF NOT EXISTS channels (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                channel_id TEXT UNIQUE NOT NULL,
-                channel_name TEXT,
-                username TEXT,
-                added_date TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                is_active BOOLEAN DEFAULT 1
-            )
-        ''')
+        for sql in MAIN_SCHEMA:
+            cursor.execute(sql)
         
-        cursor.execute('''
-            CREATE TABLE IF NOT EXISTS posts (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                channel_id TEXT NOT NULL,
-                post_id INTEGER NOT NULL,
-                message_text TEXT,
-                views INTEGER DEFAULT 0,
-                forwards INTEGER DEFAULT 0,
-                reactions TEXT DEFAULT '{}',
-                post_date TIMESTAMP,
-                updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                UNIQUE(channel_id, post_id)
-            )
-        ''')
+        conn.commit()
         
-        cursor.execute('''
-            CREATE TABLE IF NOT EXISTS commands_log (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                user_id INTEGER,
-                command TEXT,
-                executed_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-            )
-        ''')
+        post_storage.check_shard_count(conn)
+        post_storage.init()
+        
+        # Перенос постов из старой схемы (таблица posts в основной БД)
+        cursor.execute("SELECT name FROM sqlite_master WHERE type='table' AND name='posts'")
+        if cursor.fetchone():
+            moved = post_storage.import_from(conn)
+            cursor.execute("DROP TABLE posts")
+            conn.commit()
+            logger.info(f"✅ Посты перенесены в шарды: {moved}")
+        
+        init_broadcast_tables(conn)
+        
+        # Текстовые даты → секунды Unix с индексами
+        if migrate_main(conn):
+            logger.info("✅ Даты в основной БД переведены в секунды Unix")
+        for shard in range(post_storage.shard_count):
+            shard_conn = post_storage.connect(shard)
+            migrate_shard(shard_conn)
+            shard_conn.close()
         
-        conn.commit()
         conn.close()
-        logger.info(f"✅ База данных инициализирована")
+        logger.info(f"✅ База данных инициализирована ({post_storage.shard_count} шардов постов)")
         
+    except ShardCountMismatch as e:
+        # Работа с другим числом шардов молча теряет посты — не запускаемся
+        logger.critical(f"❌ {e}")
+        raise
     except Exception as e:
         logger.error(f"❌ Ошибка инициализации БД: {e}")
         logger.error(traceback.format_exc())
@@ -96,74 +224,97 @@ def get_db_connection():
     conn.row_factory = sqlite3.Row
     return conn
 
-def add_user(user_id, username, first_name):
+def get_channel_names(channel_ids):
+    """Названия каналов из основной БД: {channel_id: channel_name}"""
+    if not channel_ids:
+        return {}
+    channel_ids = list(channel_ids)
+    conn = get_db_connection()
+    cursor = conn.cursor()
+    cursor.execute(
+        f"SELECT channel_id, channel_name FROM channels WHERE channel_id IN ({', '.join('?' * len(channel_ids))})",
+        channel_ids
+    )
+    names = {row['channel_id']: row['channel_name'] for row in cursor.fetchall()}
+    conn.close()
+    return names
+
+def save_posts(posts):
+    """Запись метрик постов в шарды и обновление трендов"""
+    posts = list(posts)
+    written = post_storage.upsert_posts(posts)
+    trending.observe_many((post[0], post[1], post[3]) for post in posts)
+    report_cache.bump({post[0] for post in posts})
+    return written
+
+def is_admin(user_id):
+    return user_id in ADMIN_IDS
+
+def add_user(cursor, user_id, username, first_name):
     """Добавление пользователя в БД"""
-    try:
-        conn = get_db_connection()
-        cursor = conn.cursor()
-        cursor.execute('''
-            INSERT OR IGNORE INTO users (user_id, username, first_name, last_activity)
-            VALUES (?, ?, ?, ?)
-        ''', (user_id, username, first_name, datetime.now()))
-        conn.commit()
-        conn.close()
-    except Exception as e:
-        logger.error(f"Ошибка добавления пользователя: {e}")
+    cursor.execute('''
+        INSERT OR IGNORE INTO users (user_id, username, first_name, join_date, last_activity)
+        VALUES (?, ?, ?, ?, ?)
+    ''', (user_id, username, first_name, now_ts(), now_ts()))
+    # Написал боту — значит, снова доступен для рассылок
+    cursor.execute("UPDATE users SET is_blocked = 0 WHERE user_id = ? AND is_blocked = 1", (user_id,))
 
-def log_command(user_id, command):
+def log_command(cursor, user_id, command):
     """Логирование команд"""
+    cursor.execute(
+        "INSERT INTO commands_log (user_id, command, executed_at) VALUES (?, ?, ?)",
+        (user_id, command, now_ts())
+    )
+
+def track_command(user, command):
+    """Добавляем пользователя и логируем команду — одно соединение и один коммит"""
     try:
         conn = get_db_connection()
         cursor = conn.cursor()
-        cursor.execute(
-            "INSERT INTO commands_log (user_id, command) VALUES (?, ?)",
-            (user_id, command)
-        )
+        add_user(cursor, user.id, user.username, user.first_name)
+        log_command(cursor, user.id, command)
         conn.commit()
         conn.close()
     except Exception as e:
-        logger.error(f"Ошибка логирования: {e}")
+        logger.error(f"Ошибка логирования команды: {e}")
+
+def make_reply(text, **kwargs):
+    """Ответ обработчика — аргументы reply_to, одинаковые для TeleBot и AsyncTeleBot.
+
+    Функции *_reply только читают/пишут БД и собирают текст, а отправкой
+    занимается рантайм: здесь — синхронный бот, в async_app — асинхронный.
+    """
+    return {'text': text, **kwargs}
 
 # ========== КОМАНДЫ БОТА ==========
-@bot.message_handler(commands=['start', 'help', 'stats', 'top', 'test', 'channels', 'about', 'status', 'myinfo'])
+BOT_COMMANDS = ['start', 'help', 'stats', 'top', 'test', 'channels', 'about', 'status', 'myinfo', 'trending', 'report', 'profile', 'memprofile', 'activity', 'broadcast']
+
+@bot.message_handler(commands=BOT_COMMANDS)
 def handle_commands(message):
     """Обработчик всех команд"""
     try:
         command = message.text.split()[0].lower()
         user = message.from_user
         
+        bind(user_id=user.id, command=command)
         logger.info(f"📨 Команда от {user.id} (@{user.username}): {command}")
         
-        # Добавляем пользователя и логируем команду
-        add_user(user.id, user.username, user.first_name)
-        log_command(user.id, command)
+        track_command(user, command)
         
         # Перенаправляем на соответствующий обработчик
-        if command == '/start':
-            handle_start(message)
-        elif command == '/help':
-            handle_help(message)
-        elif command == '/stats':
-            handle_stats(message)
-        elif command == '/top':
-            handle_top(message)
-        elif command == '/test':
-            handle_test(message)
-        elif command == '/channels':
-            handle_channels(message)
-        elif command == '/about':
-            handle_about(message)
-        elif command == '/status':
-            handle_status(message)
-        elif command == '/myinfo':
-            handle_myinfo(message)
+        if command in COMMAND_REPLIES:
+            bot.reply_to(message, **COMMAND_REPLIES[command](message))
+        elif command == '/report':
+            handle_report(message)
+        elif command in ADMIN_COMMANDS:
+            ADMIN_COMMANDS[command](message)
             
     except Exception as e:
         logger.error(f"❌ Ошибка обработки команды: {e}")
         logger.error(traceback.format_exc())
         bot.reply_to(message, "❌ Произошла ошибка при обработке команды")
 
-def handle_start(message):
+def start_reply(message):
     """Команда /start"""
     user = message.from_user
     welcome_text = f"""
@@ -174,6 +325,7 @@ def handle_start(message):
 ✨ **ОСНОВНЫЕ КОМАНДЫ:**
 `/stats` — статистика бота
 `/top` — топ постов
+`/trending` — набирающие просмотры
 `/channels` — список каналов
 `/test` — тестовые данные
 `/help` — все команды
@@ -184,9 +336,9 @@ def handle_start(message):
 🔗 **Ссылка:** {BOT_LINK}
 🆔 **Ваш ID:** `{user.id}`
     """
-    bot.reply_to(message, welcome_text, parse_mode='Markdown')
+    return make_reply(welcome_text, parse_mode='Markdown')
 
-def handle_help(message):
+def help_reply(message):
     """Команда /help"""
     help_text = f"""
 📚 **ПОЛНЫЙ СПИСОК КОМАНД:**
@@ -198,8 +350,11 @@ def handle_help(message):
 `/myinfo` — Информация о вас
 
 🔹 **Аналитика:**
-`/top [N]` — Топ-N постов (по умолчанию 10)
+`/top [N]` — Топ-N постов (по умолчанию 10, до 100 по страницам)
+`/trending [N]` — Посты, которые набирают просмотры сейчас
+`/report @канал` — Графики и недельный дайджест канала
 `/channels` — Список каналов
+`/activity [day|hour] [N]` — Активность по дням или часам
 
 🔹 **Тестовые:**
 `/test` — Добавить тестовые данные
@@ -212,9 +367,9 @@ def handle_help(message):
 🌐 **Сервер:** Render.com
 📊 **База данных:** SQLite
     """
-    bot.reply_to(message, help_text, parse_mode='Markdown')
+    return make_reply(help_text, parse_mode='Markdown')
 
-def handle_stats(message):
+def stats_reply(message):
     """Статистика бота"""
     try:
         conn = get_db_connection()
@@ -226,17 +381,12 @@ def handle_stats(message):
         cursor.execute("SELECT COUNT(*) FROM channels")
         channels = cursor.fetchone()[0]
         
-        cursor.execute("SELECT COUNT(*) FROM posts")
-        posts = cursor.fetchone()[0]
-        
-        cursor.execute("SELECT SUM(views) FROM posts")
-        views = cursor.fetchone()[0] or 0
+        posts, views = post_storage.totals()
         
         cursor.execute("SELECT COUNT(*) FROM commands_log")
         commands = cursor.fetchone()[0]
         
-        cursor.execute("SELECT strftime('%Y-%m-%d', executed_at) as date, COUNT(*) FROM commands_log GROUP BY date ORDER BY date DESC LIMIT 7")
-        recent_commands = cursor.fetchall()
+        recent_commands = histogram(conn, 'commands_log', 'executed_at', bucket_bounds('day', 7, BOT_TZ))
         
         conn.close()
         
@@ -251,8 +401,8 @@ def handle_stats(message):
 
 📈 **Активность (7 дней):**
 """
-        for row in recent_commands:
-            stats_text += f"• {row['date']}: {row['COUNT(*)']} команд\n"
+        for day_start, count in reversed(recent_commands):
+            stats_text += f"• {format_ts(day_start, BOT_TZ, '%Y-%m-%d')}: {count} команд\n"
 
         stats_text += f"""
 🌐 **СЕРВЕР:**
@@ -264,13 +414,13 @@ def handle_stats(message):
 🔗 **Ссылка:** {BOT_LINK}
         """
         
-        bot.reply_to(message, stats_text, parse_mode='Markdown')
+        return make_reply(stats_text, parse_mode='Markdown')
         
     except Exception as e:
         logger.error(f"Ошибка в stats: {e}")
-        bot.reply_to(message, "❌ Ошибка получения статистики")
+        return make_reply("❌ Ошибка получения статистики")
 
-def handle_top(message):
+def top_reply(message):
     """Топ постов по просмотрам"""
     try:
         args = message.text.split()
@@ -279,57 +429,380 @@ def handle_top(message):
         if len(args) > 1:
             try:
                 limit = int(args[1])
-                limit = max(1, min(limit, 20))
+                limit = max(1, min(limit, TOP_MAX))
             except:
                 pass
         
-        conn = get_db_connection()
-        cursor = conn.cursor()
+        keys = post_storage.top_post_keys(limit)
         
-        cursor.execute('''
-            SELECT p.channel_id, p.message_text, p.views, p.forwards, 
-                   p.reactions, c.channel_name
-            FROM posts p
-            LEFT JOIN channels c ON p.channel_id = c.channel_id
-            WHERE p.views > 0
-            ORDER BY p.views DESC 
-            LIMIT ?
-        ''', (limit,))
+        if not keys:
+            return make_reply("📭 Нет данных о постах. Используйте `/test` для добавления тестовых данных.", parse_mode='Markdown')
         
-        posts = cursor.fetchall()
-        conn.close()
+        return page_reply(message, 'top', keys)
+        
+    except Exception as e:
+        logger.error(f"Ошибка в top: {e}")
+        return make_reply("❌ Ошибка получения топа")
+
+def render_top_page(keys, page):
+    """Страница топа: строки постов только для ключей этой страницы"""
+    page, page_keys = page_slice(keys, page, PAGE_SIZE)
+    posts = post_storage.get_posts(page_keys)
+    channel_names = get_channel_names({channel_id for channel_id, _ in page_keys})
+    
+    response = f"🏆 **ТОП-{len(keys)} ПОСТОВ**\n\n"
+    
+    for i, key in enumerate(page_keys, page * PAGE_SIZE + 1):
+        post = posts.get(tuple(key))
+        if post is None:
+            continue
+        
+        medal = ['🥇', '🥈', '🥉'][i-1] if i <= 3 else f"{i}."
+        
+        text = post['message_text'] or "Без текста"
+        if len(text) > 50:
+            text = text[:47] + "..."
+        
+        channel = channel_names.get(post['channel_id']) or post['channel_id']
+        
+        response += f"{medal} **{post['views']:,}** просмотров\n"
+        response += f"   📍 {channel}\n"
+        response += f"   📝 {text}\n"
+        if post['forwards'] > 0:
+            response += f"   📤 {post['forwards']} репостов\n"
+        response += "\n"
+    
+    response += f"📊 Всего в топе: {len(keys)} постов"
+    return response
+
+def get_trending(limit):
+    """Трендовые посты с текстом и названием канала"""
+    top = trending.top(limit)
+    posts = post_storage.get_posts([(channel_id, post_id) for channel_id, post_id, _ in top])
+    channel_names = get_channel_names({channel_id for channel_id, _, _ in top})
+    result = []
+    for channel_id, post_id, score in top:
+        post = posts.get((channel_id, post_id))
+        result.append({
+            "channel_id": channel_id,
+            "channel_name": channel_names.get(channel_id),
+            "post_id": post_id,
+            "message_text": post['message_text'] if post else None,
+            "views": post['views'] if post else None,
+            "views_per_hour": round(score * 3600, 1)
+        })
+    return result
+
+def trending_reply(message):
+    """Посты с наибольшей скоростью набора просмотров"""
+    try:
+        args = message.text.split()
+        limit = 10
+        
+        if len(args) > 1:
+            try:
+                limit = int(args[1])
+                limit = max(1, min(limit, 20))
+            except:
+                pass
+        
+        posts = get_trending(limit)
         
         if not posts:
-            bot.reply_to(message, "📭 Нет данных о постах. Используйте `/test` для добавления тестовых данных.", parse_mode='Markdown')
-            return
+            return make_reply("📭 Пока нет трендовых постов — данные появятся после обновления метрик.", parse_mode='Markdown')
         
-        response = f"🏆 **ТОП-{len(posts)} ПОСТОВ**\n\n"
+        response = f"🚀 **В ТРЕНДЕ СЕЙЧАС**\n\n"
         
         for i, post in enumerate(posts, 1):
-            medal = ['🥇', '🥈', '🥉'][i-1] if i <= 3 else f"{i}."
-            
             text = post['message_text'] or "Без текста"
             if len(text) > 50:
                 text = text[:47] + "..."
             
             channel = post['channel_name'] or post['channel_id']
             
-            response += f"{medal} **{post['views']:,}** просмотров\n"
+            response += f"{i}. **+{post['views_per_hour']:,.0f}** просмотров/час\n"
             response += f"   📍 {channel}\n"
             response += f"   📝 {text}\n"
-            if post['forwards'] > 0:
-                response += f"   📤 {post['forwards']} репостов\n"
+            if post['views']:
+                response += f"   👁️ Всего: {post['views']:,}\n"
             response += "\n"
         
-        response += f"📊 Всего в топе: {len(posts)} постов"
+        return make_reply(response, parse_mode='Markdown')
         
-        bot.reply_to(message, response, parse_mode='Markdown')
+    except Exception as e:
+        logger.error(f"Ошибка в trending: {e}")
+        return make_reply("❌ Ошибка получения трендов")
+
+def build_weekly_digest(channel_id, channel_name):
+    """Текстовый дайджест канала за последние 7 дней"""
+    (posts_count, views, forwards), best = post_storage.channel_digest(channel_id, now_ts() - 7 * 86400)
+    
+    digest = f"📰 **ДАЙДЖЕСТ ЗА НЕДЕЛЮ: {channel_name or channel_id}**\n\n"
+    digest += f"📝 Постов: {posts_count}\n"
+    digest += f"👁️ Просмотров: {views:,}\n"
+    digest += f"📤 Репостов: {forwards:,}\n"
+    
+    if best:
+        digest += "\n🏆 **Лучшие посты:**\n"
+        for post in best:
+            text = post['message_text'] or "Без текста"
+            if len(text) > 50:
+                text = text[:47] + "..."
+            digest += f"• {post['views'] or 0:,} — {text}\n"
+    return digest
+
+def views_by_day(channel_id, bounds):
+    """Просмотры постов канала по дням публикации в часовом поясе бота"""
+    buckets = post_storage.channel_views_by_bucket(channel_id, bounds)
+    return [format_ts(start, BOT_TZ, '%Y-%m-%d') for start, _ in buckets], [views for _, views in buckets]
+
+def send_report_chart(message, key, future, caption):
+    """Отправка графика по готовности; после первой загрузки — по file_id.
+
+    Колбэк future вызывается в служебном потоке ProcessPoolExecutor, поэтому
+    он только передает отправку в report_sender.
+    """
+    def send(future):
+        try:
+            entry = future.result()
+            photo = entry['file_id'] or entry['png']
+            sent = bot.send_photo(message.chat.id, photo, caption=caption, reply_to_message_id=message.message_id)
+            if not entry['file_id'] and sent.photo:
+                report_cache.put(key, file_id=sent.photo[-1].file_id)
+        except Exception as e:
+            logger.error(f"Ошибка отправки графика: {e}")
+    
+    future.add_done_callback(lambda future: report_sender.submit(send, future))
+
+def report_reply(message):
+    """Отчет по каналу: дайджест и [(ключ кэша, future графика, подпись)]"""
+    try:
+        args = message.text.split()
+        if len(args) < 2:
+            return make_reply("ℹ️ Использование: `/report @канал`", parse_mode='Markdown'), []
+        
+        channel_id = args[1] if args[1].startswith('@') else f"@{args[1]}"
+        if channel_id not in post_storage.channel_totals([channel_id]):
+            return make_reply(f"📭 Нет данных по каналу {channel_id}"), []
+        
+        channel_name = get_channel_names([channel_id]).get(channel_id)
+        title = channel_name or channel_id
+        digest = make_reply(build_weekly_digest(channel_id, channel_name), parse_mode='Markdown')
+        
+        if not charts_available():
+            return digest, []
+        
+        # Ключи строятся до чтения постов: при попадании в кэш агрегаты не считаются.
+        # График — за последние 90 дней; начало текущего дня в ключе, чтобы окно сдвигалось.
+        generation = report_cache.generation(channel_id)
+        bounds = bucket_bounds('day', BUCKET_UNITS['day'][2], BOT_TZ)
+        charts = []
+        
+        key = (channel_id, 'views', generation, bounds[-1][0])
+        future = report_renderer.cached(key)
+        if future is None:
+            days, views = views_by_day(channel_id, bounds)
+            if days:
+                future = report_renderer.render(key, render_views_chart, title, days, views)
+        if future is not None:
+            charts.append((key, future, f"📈 Просмотры по дням — {title}"))
+        
+        key = (channel_id, 'reactions', generation)
+        future = report_renderer.cached(key)
+        if future is None:
+            reactions = post_storage.channel_reactions(channel_id)
+            if reactions:
+                labels = sorted(reactions, key=reactions.get, reverse=True)
+                future = report_renderer.render(key, render_reactions_chart, title, labels, [reactions[label] for label in labels])
+        if future is not None:
+            charts.append((key, future, f"❤️ Реакции — {title}"))
+        
+        return digest, charts
         
     except Exception as e:
-        logger.error(f"Ошибка в top: {e}")
-        bot.reply_to(message, "❌ Ошибка получения топа")
+        logger.error(f"Ошибка в report: {e}")
+        return make_reply("❌ Ошибка построения отчета"), []
+
+def handle_report(message):
+    """Отчет по каналу: графики и недельный дайджест"""
+    reply, charts = report_reply(message)
+    bot.reply_to(message, **reply)
+    for key, future, caption in charts:
+        send_report_chart(message, key, future, caption)
+
+def get_activity(unit, count):
+    """Гистограмма команд по интервалам в часовом поясе бота"""
+    conn = get_db_connection()
+    try:
+        return histogram(conn, 'commands_log', 'executed_at', bucket_bounds(unit, count, BOT_TZ))
+    finally:
+        conn.close()
+
+def parse_activity_args(args):
+    """[day|hour] [N] → (unit, count) с ограничением по BUCKET_UNITS"""
+    unit = 'day'
+    count = None
+    for arg in args:
+        if arg.lower() in BUCKET_UNITS:
+            unit = arg.lower()
+        else:
+            try:
+                count = int(arg)
+            except ValueError:
+                pass
+    _, default, maximum = BUCKET_UNITS[unit]
+    return unit, max(1, min(count or default, maximum))
+
+def activity_reply(message):
+    """Активность пользователей по дням или часам"""
+    try:
+        unit, count = parse_activity_args(message.text.split()[1:])
+        buckets = get_activity(unit, count)
+        
+        peak = max((value for _, value in buckets), default=0)
+        label_format = '%m-%d' if unit == 'day' else '%m-%d %H:00'
+        
+        response = f"📈 **АКТИВНОСТЬ ({'по дням' if unit == 'day' else 'по часам'}, {BOT_TIMEZONE})**\n\n"
+        response += "```\n"
+        for start, value in buckets:
+            bar = '█' * round(value / peak * 15) if peak else ''
+            response += f"{format_ts(start, BOT_TZ, label_format)} {bar} {value}\n"
+        response += "```\n"
+        response += f"⚡ Всего команд: {sum(value for _, value in buckets)}"
+        
+        return make_reply(response, parse_mode='Markdown')
+        
+    except Exception as e:
+        logger.error(f"Ошибка в activity: {e}")
+        return make_reply("❌ Ошибка получения активности")
 
-def handle_test(message):
+def format_broadcast(job):
+    """Текст прогресса рассылки для админа"""
+    processed = job['sent'] + job['failed'] + job['blocked']
+    percent = processed * 100 // job['total'] if job['total'] else 100
+    status = {'running': '⏳ Идет', 'done': '✅ Завершена', 'cancelled': '⛔ Отменена'}.get(job['status'], job['status'])
+    
+    text = f"📣 Рассылка #{job['id']}: {status}\n\n"
+    text += f"Обработано: {processed} из {job['total']} ({percent}%)\n"
+    text += f"✅ Доставлено: {job['sent']}\n"
+    text += f"🚫 Заблокировали бота: {job['blocked']}\n"
+    text += f"❌ Ошибок: {job['failed']}\n"
+    if job.get('eta') is not None:
+        text += f"⏱ Осталось примерно: {int(job['eta'] // 60)} мин {int(job['eta'] % 60)} с\n"
+    return text
+
+def update_broadcast_progress(job):
+    """Обновление сообщения с прогрессом у админа"""
+    if not job or not job['progress_message_id']:
+        return
+    try:
+        bot.edit_message_text(format_broadcast(job), job['chat_id'], job['progress_message_id'])
+    except Exception as e:
+        # «message is not modified» и т.п. не должны останавливать рассылку
+        logger.warning(f"Не удалось обновить прогресс рассылки: {e}")
+
+broadcast_engine = BroadcastEngine(
+    lambda: get_db_connection(),
+    lambda user_id, text: bot.send_message(user_id, text),
+    rate=BROADCAST_RATE,
+    concurrency=BROADCAST_CONCURRENCY,
+    on_progress=update_broadcast_progress,
+    on_error=lambda broadcast_id, e: logger.error(f"❌ Ошибка рассылки #{broadcast_id}: {e}")
+)
+
+def handle_broadcast(message):
+    """Рассылка всем пользователям (только для админов)"""
+    if not is_admin(message.from_user.id):
+        bot.reply_to(message, "⛔ Команда доступна только администраторам")
+        return
+    
+    try:
+        parts = message.text.split(maxsplit=1)
+        text = parts[1].strip() if len(parts) > 1 else ''
+        action = text.split()[0].lower() if text else ''
+        
+        if not text:
+            bot.reply_to(message, "ℹ️ Использование:\n/broadcast <текст>\n/broadcast status [id]\n/broadcast cancel [id]")
+            return
+        
+        if action in ('status', 'cancel'):
+            args = text.split()
+            broadcast_id = int(args[1]) if len(args) > 1 and args[1].isdigit() else None
+            job = broadcast_engine.get(broadcast_id)
+            if job is None:
+                bot.reply_to(message, "📭 Рассылок еще не было")
+                return
+            if action == 'cancel':
+                cancelled = broadcast_engine.cancel(job['id'])
+                bot.reply_to(message, f"⛔ Рассылка #{job['id']} отменена" if cancelled else f"ℹ️ Рассылка #{job['id']} уже не выполняется")
+            else:
+                bot.reply_to(message, format_broadcast(job))
+            return
+        
+        progress = bot.reply_to(message, "📣 Рассылка запускается...")
+        broadcast_id = broadcast_engine.start(message.from_user.id, message.chat.id, text, progress.message_id)
+        logger.info(f"📣 Рассылка #{broadcast_id} запущена")
+        
+    except Exception as e:
+        logger.error(f"Ошибка в broadcast: {e}")
+        bot.reply_to(message, f"❌ Ошибка рассылки: {str(e)[:100]}")
+
+def parse_profile_seconds(message, default=30):
+    args = message.text.split()
+    try:
+        seconds = int(args[1]) if len(args) > 1 else default
+    except ValueError:
+        seconds = default
+    return max(1, min(seconds, MAX_PROFILE_SECONDS))
+
+def send_profile_result(chat_id, title, summary, filename, data):
+    """Сводка профиля текстом и файл для скачивания"""
+    try:
+        bot.send_message(chat_id, f"{title}\n\n{summary}")
+        if data:
+            document = io.BytesIO(data)
+            document.name = filename
+            bot.send_document(chat_id, document)
+    except Exception as e:
+        logger.error(f"Ошибка отправки профиля: {e}")
+
+def handle_profile(message):
+    """Профилирование обработки запросов (только для админов)"""
+    if not is_admin(message.from_user.id):
+        bot.reply_to(message, "⛔ Команда доступна только администраторам")
+        return
+    
+    seconds = parse_profile_seconds(message)
+    chat_id = message.chat.id
+    started = request_profiler.start(
+        seconds,
+        lambda summary, filename, data: send_profile_result(chat_id, "⏱ Профиль запросов (cProfile)", summary, filename, data)
+    )
+    
+    if started:
+        bot.reply_to(message, f"⏱ Профилирование запущено на {seconds} с")
+    else:
+        bot.reply_to(message, "⚠️ Профилирование уже идет")
+
+def handle_memprofile(message):
+    """Снимки tracemalloc (только для админов)"""
+    if not is_admin(message.from_user.id):
+        bot.reply_to(message, "⛔ Команда доступна только администраторам")
+        return
+    
+    seconds = parse_profile_seconds(message)
+    chat_id = message.chat.id
+    started = memory_profiler.start(
+        seconds,
+        lambda summary, filename, data: send_profile_result(chat_id, "🧠 Профиль памяти (tracemalloc)", summary, filename, data)
+    )
+    
+    if started:
+        bot.reply_to(message, f"🧠 Отслеживание памяти запущено на {seconds} с")
+    else:
+        bot.reply_to(message, "⚠️ Отслеживание памяти уже идет")
+
+def test_reply(message):
     """Добавление тестовых данных"""
     try:
         conn = get_db_connection()
@@ -362,6 +835,7 @@ def handle_test(message):
             "Мобильная разработка: тренды"
         ]
         
+        test_posts = []
         for i in range(1, 31):
             channel = random.choice(test_channels)[0]
             views = random.randint(1000, 50000)
@@ -373,33 +847,31 @@ def handle_test(message):
                     if random.random() > 0.5:
                         reactions[emoji] = random.randint(10, 200)
             
-            cursor.execute('''
-                INSERT OR REPLACE INTO posts 
-                (channel_id, post_id, message_text, views, forwards, reactions, post_date)
-                VALUES (?, ?, ?, ?, ?, ?, ?)
-            ''', (
+            test_posts.append((
                 channel,
                 i,
                 f"{random.choice(topics)} (Пост #{i})",
                 views,
                 forwards,
                 json.dumps(reactions),
-                (datetime.now() - timedelta(days=random.randint(0, 30))).isoformat()
+                now_ts() - random.randint(0, 30) * 86400
             ))
         
+        save_posts(test_posts)
+        
         # Тестовые пользователи (если нет)
         cursor.execute("SELECT COUNT(*) FROM users")
         if cursor.fetchone()[0] < 5:
             for i in range(5):
                 cursor.execute('''
-                    INSERT OR IGNORE INTO users (user_id, username, first_name, last_activity)
-                    VALUES (?, ?, ?, ?)
-                ''', (1000000 + i, f"test_user_{i}", f"Test {i}", datetime.now()))
+                    INSERT OR IGNORE INTO users (user_id, username, first_name, join_date, last_activity)
+                    VALUES (?, ?, ?, ?, ?)
+                ''', (1000000 + i, f"test_user_{i}", f"Test {i}", now_ts(), now_ts()))
         
         conn.commit()
         conn.close()
         
-        bot.reply_to(message, f"""
+        return make_reply(f"""
 ✅ **Тестовые данные добавлены!**
 
 📁 Добавлено/обновлено:
@@ -417,52 +889,134 @@ def handle_test(message):
         
     except Exception as e:
         logger.error(f"Ошибка в test: {e}")
-        bot.reply_to(message, f"❌ Ошибка: {str(e)[:100]}")
+        return make_reply(f"❌ Ошибка: {str(e)[:100]}")
 
-def handle_channels(message):
+def channels_reply(message):
     """Список каналов"""
     try:
         conn = get_db_connection()
         cursor = conn.cursor()
         
         cursor.execute('''
-            SELECT channel_name, username, added_date,
-                   (SELECT COUNT(*) FROM posts WHERE channel_id = channels.channel_id) as posts_count,
-                   (SELECT SUM(views) FROM posts WHERE channel_id = channels.channel_id) as total_views
+            SELECT channel_id
             FROM channels 
             WHERE is_active = 1
             ORDER BY added_date DESC 
-            LIMIT 10
-        ''')
+            LIMIT ?
+        ''', (CHANNELS_MAX,))
         
-        channels = cursor.fetchall()
+        channel_ids = [row['channel_id'] for row in cursor.fetchall()]
         conn.close()
         
-        if not channels:
-            bot.reply_to(message, "📭 Нет каналов в базе данных. Используйте `/test` для добавления тестовых данных.", parse_mode='Markdown')
-            return
-        
-        response = "📋 **СПИСОК КАНАЛОВ**\n\n"
-        
-        for i, channel in enumerate(channels, 1):
-            total_views = channel['total_views'] or 0
-            response += f"{i}. **{channel['channel_name']}**\n"
-            if channel['username']:
-                response += f"   @{channel['username']}\n"
-            response += f"   📝 Постов: {channel['posts_count']}\n"
-            response += f"   👁️ Просмотров: {total_views:,}\n"
-            response += f"   📅 Добавлен: {channel['added_date'][:10]}\n"
-            response += "\n"
-        
-        response += f"📊 Всего активных каналов: {len(channels)}"
+        if not channel_ids:
+            return make_reply("📭 Нет каналов в базе данных. Используйте `/test` для добавления тестовых данных.", parse_mode='Markdown')
         
-        bot.reply_to(message, response, parse_mode='Markdown')
+        return page_reply(message, 'channels', channel_ids)
         
     except Exception as e:
         logger.error(f"Ошибка в channels: {e}")
-        bot.reply_to(message, "❌ Ошибка получения списка")
+        return make_reply("❌ Ошибка получения списка")
+
+def render_channels_page(channel_ids, page):
+    """Страница списка каналов: выборка по channel_id только этой страницы"""
+    page, page_ids = page_slice(channel_ids, page, PAGE_SIZE)
+    
+    conn = get_db_connection()
+    cursor = conn.cursor()
+    cursor.execute(f'''
+        SELECT channel_id, channel_name, username, added_date
+        FROM channels
+        WHERE channel_id IN ({', '.join('?' * len(page_ids))})
+    ''', page_ids)
+    channels = {row['channel_id']: row for row in cursor.fetchall()}
+    conn.close()
+    
+    totals = post_storage.channel_totals(page_ids)
+    
+    response = "📋 **СПИСОК КАНАЛОВ**\n\n"
+    
+    for i, channel_id in enumerate(page_ids, page * PAGE_SIZE + 1):
+        channel = channels.get(channel_id)
+        if channel is None:
+            continue
+        posts_count, total_views = totals.get(channel_id, (0, 0))
+        response += f"{i}. **{channel['channel_name']}**\n"
+        if channel['username']:
+            response += f"   @{channel['username']}\n"
+        response += f"   📝 Постов: {posts_count}\n"
+        response += f"   👁️ Просмотров: {total_views:,}\n"
+        response += f"   📅 Добавлен: {channel['added_date'][:10]}\n"
+        response += "\n"
+    
+    response += f"📊 Всего активных каналов: {len(channel_ids)}"
+    return response
+
+PAGE_RENDERERS = {
+    'top': render_top_page,
+    'channels': render_channels_page,
+}
+
+def page_markup(token, page, pages):
+    """Кнопки «назад / N из M / вперед»"""
+    if pages <= 1:
+        return None
+    buttons = []
+    if page > 0:
+        buttons.append(telebot.types.InlineKeyboardButton("⬅️ Назад", callback_data=f"pg:{token}:{page - 1}"))
+    buttons.append(telebot.types.InlineKeyboardButton(f"{page + 1}/{pages}", callback_data="pg:noop"))
+    if page < pages - 1:
+        buttons.append(telebot.types.InlineKeyboardButton("Вперед ➡️", callback_data=f"pg:{token}:{page + 1}"))
+    markup = telebot.types.InlineKeyboardMarkup()
+    markup.row(*buttons)
+    return markup
+
+def page_reply(message, kind, ids):
+    """Первая страница результата; id сохраняются для листания"""
+    token = result_cursors.create(message.chat.id, kind, ids, PAGE_SIZE)
+    return make_reply(
+        PAGE_RENDERERS[kind](ids, 0),
+        parse_mode='Markdown',
+        reply_markup=page_markup(token, 0, page_count(len(ids), PAGE_SIZE))
+    )
 
-def handle_about(message):
+def page_callback_reply(call):
+    """(аргументы edit_message_text или None, текст для answer_callback_query)"""
+    parts = call.data.split(':')
+    if len(parts) != 3:
+        return None, None
+    
+    cursor = result_cursors.get(call.message.chat.id, parts[1])
+    if cursor is None:
+        return None, "⌛ Результат устарел, повторите команду"
+    
+    pages = page_count(len(cursor['ids']), cursor['page_size'])
+    page = max(0, min(int(parts[2]), pages - 1))
+    
+    return {
+        'text': PAGE_RENDERERS[cursor['kind']](cursor['ids'], page),
+        'chat_id': call.message.chat.id,
+        'message_id': call.message.message_id,
+        'parse_mode': 'Markdown',
+        'reply_markup': page_markup(parts[1], page, pages),
+    }, None
+
+def is_page_callback(call):
+    return (call.data or '').startswith('pg:')
+
+@bot.callback_query_handler(func=is_page_callback)
+def handle_page_callback(call):
+    """Листание страниц: правка сообщения на месте без повторной сортировки"""
+    try:
+        edit, notice = page_callback_reply(call)
+        if edit:
+            bot.edit_message_text(**edit)
+        bot.answer_callback_query(call.id, notice)
+        
+    except Exception as e:
+        logger.error(f"Ошибка листания: {e}")
+        bot.answer_callback_query(call.id, "❌ Ошибка")
+
+def about_reply(message):
     """О боте"""
     about_text = f"""
 🤖 **Telegram Analytics Bot**
@@ -490,9 +1044,9 @@ def handle_about(message):
 
 📊 *Версия 2.0.0*
     """
-    bot.reply_to(message, about_text, parse_mode='Markdown')
+    return make_reply(about_text, parse_mode='Markdown')
 
-def handle_status(message):
+def status_reply(message):
     """Статус сервера"""
     try:
         conn = get_db_connection()
@@ -519,6 +1073,8 @@ def handle_status(message):
 • Таблиц: {tables}
 • Имена: {', '.join(table_names)}
 • Путь: {DB_PATH}
+• Шардов постов: {post_storage.shard_count}
+• Бэкап: {database_backup.last_backup.strftime('%Y-%m-%d %H:%M:%S') if database_backup.last_backup else 'еще не было'}
 
 **Сервер:**
 • Хостинг: Render.com
@@ -533,13 +1089,13 @@ def handle_status(message):
 💡 *Все системы работают нормально*
         """
         
-        bot.reply_to(message, status_text, parse_mode='Markdown')
+        return make_reply(status_text, parse_mode='Markdown')
         
     except Exception as e:
         logger.error(f"Ошибка в status: {e}")
-        bot.reply_to(message, f"❌ Ошибка проверки статуса: {str(e)[:100]}")
+        return make_reply(f"❌ Ошибка проверки статуса: {str(e)[:100]}")
 
-def handle_myinfo(message):
+def myinfo_reply(message):
     """Информация о пользователе"""
     user = message.from_user
     
@@ -558,8 +1114,8 @@ def handle_myinfo(message):
         conn.close()
         
         if user_data:
-            join_date = user_data['join_date'][:10] if user_data['join_date'] else "Неизвестно"
-            last_activity = user_data['last_activity'] or "Неизвестно"
+            join_date = format_ts(user_data['join_date'], BOT_TZ, '%Y-%m-%d') or "Неизвестно"
+            last_activity = format_ts(user_data['last_activity'], BOT_TZ, '%Y-%m-%d %H:%M:%S') or "Неизвестно"
             commands_count = user_data['commands_count']
         else:
             join_date = "Сегодня"
@@ -578,7 +1134,7 @@ def handle_myinfo(message):
 
 **Активность:**
 • Дата регистрации: {join_date}
-• Последняя активность: {last_activity[:19]}
+• Последняя активность: {last_activity}
 • Выполнено команд: {commands_count}
 
 **Бот:**
@@ -589,11 +1145,11 @@ def handle_myinfo(message):
 💡 *Данные хранятся в защищенной базе данных*
         """
         
-        bot.reply_to(message, myinfo_text, parse_mode='Markdown')
+        return make_reply(myinfo_text, parse_mode='Markdown')
         
     except Exception as e:
         logger.error(f"Ошибка в myinfo: {e}")
-        bot.reply_to(message, f"❌ Ошибка получения информации: {str(e)[:100]}")
+        return make_reply(f"❌ Ошибка получения информации: {str(e)[:100]}")
 
 @bot.message_handler(func=lambda message: True)
 def handle_all_messages(message):
@@ -601,10 +1157,15 @@ def handle_all_messages(message):
     user = message.from_user
     text = message.text
     
+    bind(user_id=user.id, command='TEXT')
     logger.info(f"💬 Сообщение от {user.id}: {text[:50]}...")
     
-    add_user(user.id, user.username, user.first_name)
-    log_command(user.id, f"TEXT: {text[:30]}")
+    track_command(user, f"TEXT: {text[:30]}")
+    bot.reply_to(message, **text_reply(message))
+
+def text_reply(message):
+    """Подсказка в ответ на обычный текст"""
+    text = message.text
     
     help_response = f"""
 🤖 **Telegram Analytics Bot**
@@ -626,7 +1187,28 @@ def handle_all_messages(message):
 ❓ *Не знаете что делать? Напишите /help*
     """
     
-    bot.reply_to(message, help_response, parse_mode='Markdown')
+    return make_reply(help_response, parse_mode='Markdown')
+
+COMMAND_REPLIES = {
+    '/start': start_reply,
+    '/help': help_reply,
+    '/stats': stats_reply,
+    '/top': top_reply,
+    '/test': test_reply,
+    '/channels': channels_reply,
+    '/trending': trending_reply,
+    '/activity': activity_reply,
+    '/about': about_reply,
+    '/status': status_reply,
+    '/myinfo': myinfo_reply,
+}
+
+# Команды администратора отправляют сообщения сами (прогресс рассылки, файлы профиля)
+ADMIN_COMMANDS = {
+    '/broadcast': handle_broadcast,
+    '/profile': handle_profile,
+    '/memprofile': handle_memprofile,
+}
 
 # ========== FLASK МАРШРУТЫ ==========
 @app.route('/')
@@ -642,14 +1224,10 @@ def home():
         cursor.execute("SELECT COUNT(*) FROM channels")
         channels = cursor.fetchone()[0]
         
-        cursor.execute("SELECT COUNT(*) FROM posts")
-        posts = cursor.fetchone()[0]
-        
-        cursor.execute("SELECT SUM(views) FROM posts")
-        views = cursor.fetchone()[0] or 0
-        
         conn.close()
         
+        posts, views = post_storage.totals()
+        
         return f"""
         <!DOCTYPE html>
         <html>
@@ -732,11 +1310,10 @@ def api_stats():
         cursor.execute("SELECT COUNT(*) FROM channels")
         channels = cursor.fetchone()[0]
         
-        cursor.execute("SELECT COUNT(*) FROM posts")
-        posts = cursor.fetchone()[0]
-        
         conn.close()
         
+        posts, _ = post_storage.totals()
+        
         return jsonify({
             "status": "success",
             "bot_username": BOT_USERNAME,
@@ -756,16 +1333,110 @@ def api_stats():
             "timestamp": datetime.now().isoformat()
         }), 500
 
+@app.route('/api/trending')
+def api_trending():
+    """API трендовых постов"""
+    try:
+        limit = max(1, min(request.args.get('limit', 10, type=int), 100))
+        return jsonify({
+            "status": "success",
+            "trending": get_trending(limit)
+        })
+    except Exception as e:
+        return jsonify({
+            "status": "error",
+            "error": str(e)[:200],
+            "timestamp": datetime.now().isoformat()
+        }), 500
+
+@app.route('/api/activity')
+def api_activity():
+    """API гистограммы активности"""
+    try:
+        unit, count = parse_activity_args([request.args.get('unit', 'day'), request.args.get('range', '')])
+        return jsonify({
+            "status": "success",
+            "unit": unit,
+            "timezone": BOT_TIMEZONE,
+            "buckets": [
+                {"start": start, "label": format_ts(start, BOT_TZ), "commands": value}
+                for start, value in get_activity(unit, count)
+            ]
+        })
+    except Exception as e:
+        return jsonify({
+            "status": "error",
+            "error": str(e)[:200],
+            "timestamp": datetime.now().isoformat()
+        }), 500
+
+@app.route('/api/ingest')
+def api_ingest():
+    """Счетчики приема постов из каналов"""
+    return jsonify({
+        "status": "success",
+        "channel_posts": channel_ingestor.stats(),
+        "dropped_updates": dropped_updates
+    })
+
+@app.route('/api/logging')
+def api_logging():
+    """Состояние очереди логов"""
+    return jsonify({
+        "status": "success",
+        "logging": log_pipeline.stats()
+    })
+
+@app.route('/api/flood')
+def api_flood():
+    """Счетчики защиты от флуда"""
+    return jsonify({
+        "status": "success",
+        "flood_control": flood_control.stats()
+    })
+
+def prefilter_update(json_string):
+    """(тип, данные) тела вебхука; тип None — обновление отброшено без разбора"""
+    global dropped_updates
+    
+    data = json.loads(json_string)
+    kind = update_kind(data, HANDLED_UPDATE_KEYS)
+    bind(update_id=data.get('update_id'), kind=kind)
+    
+    if kind is None:
+        dropped_updates += 1
+    return kind, data
+
+def process_update(json_string):
+    kind, data = prefilter_update(json_string)
+    if kind is None:
+        return
+    
+    if kind in CHANNEL_UPDATE_KEYS:
+        channel_ingestor.add(data[kind])
+        return
+    
+    update = telebot.types.Update.de_json(data)
+    bot.process_new_updates([update])
+
 @app.route('/webhook', methods=['POST'])
 def webhook():
     """Вебхук Telegram"""
     try:
         if request.headers.get('content-type') == 'application/json':
             json_string = request.get_data().decode('utf-8')
-            logger.info(f"📥 Вебхук получен: {json_string[:200]}...")
+            raw_logger.info("📥 Вебхук получен: %s...", json_string[:200])
             
-            update = telebot.types.Update.de_json(json_string)
-            bot.process_new_updates([update])
+            token = log_context()
+            started = time.perf_counter()
+            try:
+                if request_profiler.enabled:
+                    request_profiler.run(process_update, json_string)
+                else:
+                    process_update(json_string)
+                logger.info("✅ Обновление обработано", extra={'duration_ms': round((time.perf_counter() - started) * 1000, 2)})
+            finally:
+                reset_log_context(token)
             
             return jsonify({"status": "ok"}), 200
         else:
@@ -777,23 +1448,62 @@ def webhook():
         return jsonify({"error": str(e)[:200]}), 500
 
 # ========== ЗАПУСК ==========
-if __name__ == '__main__':
-    logger.info("🚀 Запуск Telegram Analytics Bot...")
+WEBHOOK_URL = "https://telegram-analytics-bot-jhdy.onrender.com/webhook"
+
+def start_services():
+    """БД и фоновые задачи — общие для синхронного и асинхронного режима"""
+    # Восстановление БД из последнего бэкапа (если рабочих файлов нет)
+    try:
+        started = time.perf_counter()
+        restored = database_backup.restore()
+        if restored:
+            logger.info(f"✅ БД восстановлена из {restored} за {time.perf_counter() - started:.2f} с")
+    except Exception as e:
+        logger.error(f"❌ Ошибка восстановления БД: {e}")
     
     # Инициализация БД
     init_database()
     
+    # Продолжение рассылок, прерванных перезапуском
+    resumed = broadcast_engine.resume_pending()
+    if resumed:
+        logger.info(f"✅ Продолжены рассылки: {resumed}")
+    
+    channel_ingestor.start(on_error=lambda e: logger.error(f"❌ Ошибка записи постов каналов: {e}"))
+    
+    database_backup.start(
+        BACKUP_INTERVAL,
+        on_error=lambda e: logger.error(f"❌ Ошибка резервного копирования: {e}")
+    )
+    
+    # Восстановление трендов после перезапуска
+    try:
+        conn = get_db_connection()
+        logger.info(f"✅ Тренды загружены: {trending.load(conn)}")
+        conn.close()
+    except Exception as e:
+        logger.error(f"❌ Ошибка загрузки трендов: {e}")
+    trending.start_autosave(
+        get_db_connection,
+        TRENDING_SAVE_INTERVAL,
+        on_error=lambda e: logger.error(f"❌ Ошибка сохранения трендов: {e}")
+    )
+
+if __name__ == '__main__':
+    logger.info("🚀 Запуск Telegram Analytics Bot...")
+    
+    start_services()
+    
     logger.info(f"✅ Бот: @{BOT_USERNAME}")
     logger.info(f"🔗 Ссылка: {BOT_LINK}")
     
     # Настройка вебхука при запуске
     try:
         if 'RENDER' in os.environ:
-            webhook_url = "https://telegram-analytics-bot-jhdy.onrender.com/webhook"
             bot.remove_webhook()
             time.sleep(1)
-            bot.set_webhook(url=webhook_url, max_connections=50)
-            logger.info(f"✅ Вебхук установлен: {webhook_url}")
+            bot.set_webhook(url=WEBHOOK_URL, max_connections=50, allowed_updates=list(HANDLED_UPDATE_KEYS))
+            logger.info(f"✅ Вебхук установлен: {WEBHOOK_URL}")
             
             # Проверяем настройку
             webhook_info = bot.get_webhook_info()
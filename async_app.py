@@ -0,0 +1,360 @@
+"""Асинхронный режим бота: AsyncTeleBot + aiohttp вместо TeleBot + Flask.
+
+Запуск: python async_app.py (вместо python app.py).
+
+Логика ответов общая с app.py: функции *_reply читают БД и собирают
+текст, здесь они выполняются в отдельном пуле потоков SQLite, а
+отправка идет через общую aiohttp-сессию AsyncTeleBot. Ожидание ответа
+Telegram не занимает поток, поэтому в полете могут быть тысячи
+обновлений, а потоков — только ASYNC_DB_WORKERS.
+
+Команды администратора (/broadcast, /profile, /memprofile) и фоновые
+задачи (рассылки, прием постов каналов, бэкапы) работают как в
+синхронном режиме — через TeleBot из app.py.
+"""
+import asyncio
+import contextvars
+import functools
+import json
+import logging
+import os
+import socket
+import sys
+import threading
+import time
+import traceback
+from concurrent.futures import ThreadPoolExecutor
+
+import telebot
+from aiohttp import web
+from telebot import asyncio_helper
+from telebot.async_telebot import AsyncTeleBot
+from telebot.asyncio_handler_backends import BaseMiddleware, CancelUpdate
+from werkzeug.test import EnvironBuilder
+
+from app import (
+    ADMIN_COMMANDS, BOT_COMMANDS, BOT_TOKEN, COMMAND_REPLIES, FLOOD_WARNING, HANDLED_UPDATE_KEYS, WEBHOOK_URL,
+    app as flask_app, channel_ingestor, check_flood, init_database, is_page_callback, page_callback_reply,
+    prefilter_update, process_update as process_update_sync, report_cache, report_reply, request_profiler, start_services, text_reply, track_command,
+)
+from ingest import CHANNEL_UPDATE_KEYS
+from log_pipeline import bind, log_context, reset_log_context
+
+logger = logging.getLogger(__name__)
+raw_logger = logging.getLogger('webhook.raw')
+
+# ========== КОНФИГУРАЦИЯ ==========
+# Потоки для SQLite: запросы уходят туда, чтобы не блокировать цикл событий
+ASYNC_DB_WORKERS = int(os.environ.get('ASYNC_DB_WORKERS', 8))
+# Соединений в общей aiohttp-сессии к api.telegram.org
+ASYNC_HTTP_LIMIT = int(os.environ.get('ASYNC_HTTP_LIMIT', 200))
+# Одновременных запросов вебхука от Telegram (максимум 100)
+ASYNC_WEBHOOK_CONNECTIONS = 100
+
+asyncio_helper.REQUEST_LIMIT = ASYNC_HTTP_LIMIT
+db_executor = ThreadPoolExecutor(max_workers=ASYNC_DB_WORKERS, thread_name_prefix='sqlite')
+
+bot = AsyncTeleBot(BOT_TOKEN)
+
+# Ссылки на фоновые задачи, чтобы их не собрал сборщик мусора
+background_tasks = set()
+
+async def run_db(fn, *args):
+    """fn(*args) в пуле SQLite с контекстом логов текущего обновления"""
+    context = contextvars.copy_context()
+    if request_profiler.enabled:
+        call = functools.partial(context.run, request_profiler.run, fn, *args)
+    else:
+        call = functools.partial(context.run, fn, *args)
+    return await asyncio.get_running_loop().run_in_executor(db_executor, call)
+
+def spawn(coro):
+    task = asyncio.create_task(coro)
+    background_tasks.add(task)
+    task.add_done_callback(background_tasks.discard)
+    return task
+
+# ========== ЗАЩИТА ОТ ФЛУДА ==========
+class FloodControlMiddleware(BaseMiddleware):
+    """То же, что в app.py: проверка лимитов в памяти, без пула SQLite"""
+
+    def __init__(self):
+        super().__init__()
+        self.update_types = ['message', 'callback_query']
+
+    async def pre_process(self, message, data):
+        verdict = check_flood(message)
+        if verdict is None:
+            return None
+
+        if verdict == 'callback':
+            try:
+                await bot.answer_callback_query(message.id, FLOOD_WARNING)
+            except Exception as e:
+                logger.warning(f"Не удалось ответить на нажатие кнопки: {e}")
+        elif verdict == 'reply':
+            try:
+                await bot.reply_to(message, FLOOD_WARNING)
+            except Exception as e:
+                logger.warning(f"Не удалось отправить предупреждение о флуде: {e}")
+        return CancelUpdate()
+
+    async def post_process(self, message, data, exception=None):
+        pass
+
+bot.setup_middleware(FloodControlMiddleware())
+
+# ========== КОМАНДЫ БОТА ==========
+@bot.message_handler(commands=BOT_COMMANDS)
+async def handle_commands(message):
+    """Обработчик всех команд"""
+    try:
+        command = message.text.split()[0].lower()
+        user = message.from_user
+
+        bind(user_id=user.id, command=command)
+        logger.info(f"📨 Команда от {user.id} (@{user.username}): {command}")
+
+        await run_db(track_command, user, command)
+
+        if command in COMMAND_REPLIES:
+            reply = await run_db(COMMAND_REPLIES[command], message)
+            await bot.reply_to(message, **reply)
+        elif command == '/report':
+            await handle_report(message)
+        elif command in ADMIN_COMMANDS:
+            # Редкие команды админа отвечают синхронным ботом из потока пула
+            await run_db(ADMIN_COMMANDS[command], message)
+
+    except Exception as e:
+        logger.error(f"❌ Ошибка обработки команды: {e}")
+        logger.error(traceback.format_exc())
+        await bot.reply_to(message, "❌ Произошла ошибка при обработке команды")
+
+async def handle_report(message):
+    """Дайджест сразу, графики — по готовности, не задерживая ответ вебхуку"""
+    reply, charts = await run_db(report_reply, message)
+    await bot.reply_to(message, **reply)
+    for key, future, caption in charts:
+        spawn(send_report_chart(message, key, future, caption))
+
+async def send_report_chart(message, key, future, caption):
+    """Отправка графика по готовности; после первой загрузки — по file_id"""
+    try:
+        entry = await asyncio.wrap_future(future)
+        photo = entry['file_id'] or entry['png']
+        sent = await bot.send_photo(message.chat.id, photo, caption=caption, reply_to_message_id=message.message_id)
+        if not entry['file_id'] and sent.photo:
+            report_cache.put(key, file_id=sent.photo[-1].file_id)
+    except Exception as e:
+        logger.error(f"Ошибка отправки графика: {e}")
+
+@bot.callback_query_handler(func=is_page_callback)
+async def handle_page_callback(call):
+    """Листание страниц: правка сообщения на месте без повторной сортировки"""
+    try:
+        edit, notice = await run_db(page_callback_reply, call)
+        if edit:
+            await bot.edit_message_text(**edit)
+        await bot.answer_callback_query(call.id, notice)
+
+    except Exception as e:
+        logger.error(f"Ошибка листания: {e}")
+        await bot.answer_callback_query(call.id, "❌ Ошибка")
+
+@bot.message_handler(func=lambda message: True)
+async def handle_all_messages(message):
+    """Обработка всех остальных сообщений"""
+    user = message.from_user
+    text = message.text
+
+    bind(user_id=user.id, command='TEXT')
+    logger.info(f"💬 Сообщение от {user.id}: {text[:50]}...")
+
+    await run_db(track_command, user, f"TEXT: {text[:30]}")
+    await bot.reply_to(message, **text_reply(message))
+
+# ========== ВЕБ-СЕРВЕР ==========
+async def process_update(json_string):
+    kind, data = prefilter_update(json_string)
+    if kind is None:
+        return
+
+    if kind in CHANNEL_UPDATE_KEYS:
+        # При заполнении буфера add() сразу пишет пакет в БД
+        await run_db(channel_ingestor.add, data[kind])
+        return
+
+    update = telebot.types.Update.de_json(data)
+    await bot.process_new_updates([update])
+
+async def webhook(request):
+    """Вебхук Telegram"""
+    try:
+        if request.content_type == 'application/json':
+            json_string = await request.text()
+            raw_logger.info("📥 Вебхук получен: %s...", json_string[:200])
+
+            token = log_context()
+            started = time.perf_counter()
+            try:
+                await process_update(json_string)
+                logger.info("✅ Обновление обработано", extra={'duration_ms': round((time.perf_counter() - started) * 1000, 2)})
+            finally:
+                reset_log_context(token)
+
+            return web.json_response({"status": "ok"})
+        else:
+            logger.warning("⚠️ Неверный Content-Type")
+            return web.json_response({"error": "Invalid content type"}, status=400)
+    except Exception as e:
+        logger.error(f"❌ Ошибка вебхука: {e}")
+        logger.error(traceback.format_exc())
+        return web.json_response({"error": str(e)[:200]}, status=500)
+
+def call_flask(method, path, query_string):
+    environ = EnvironBuilder(method=method, path=path, query_string=query_string).get_environ()
+    return flask_app.response_class.from_app(flask_app, environ)
+
+async def flask_routes(request):
+    """Страница, /health и /api/* — маршруты Flask из app.py в пуле SQLite"""
+    response = await run_db(call_flask, request.method, request.path, request.query_string)
+    return web.Response(
+        body=response.get_data(),
+        status=response.status_code,
+        headers={'Content-Type': response.headers.get('Content-Type', 'text/plain')}
+    )
+
+async def setup_webhook(web_app):
+    if 'RENDER' not in os.environ:
+        return
+    try:
+        await bot.remove_webhook()
+        await asyncio.sleep(1)
+        await bot.set_webhook(url=WEBHOOK_URL, max_connections=ASYNC_WEBHOOK_CONNECTIONS, allowed_updates=list(HANDLED_UPDATE_KEYS))
+        logger.info(f"✅ Вебхук установлен: {WEBHOOK_URL}")
+    except Exception as e:
+        logger.error(f"❌ Ошибка настройки вебхука: {e}")
+
+async def shutdown(web_app):
+    if asyncio_helper.session_manager.session is not None:
+        await bot.close_session()
+    db_executor.shutdown(wait=False)
+
+def create_web_app():
+    web_app = web.Application()
+    web_app.router.add_post('/webhook', webhook)
+    web_app.router.add_get('/{path:.*}', flask_routes)
+    web_app.on_startup.append(setup_webhook)
+    web_app.on_cleanup.append(shutdown)
+    return web_app
+
+def main():
+    logger.info("🚀 Запуск Telegram Analytics Bot (asyncio)...")
+    start_services()
+
+    logger.info("📡 Режим: Вебхук (asyncio)")
+    port = int(os.environ.get('PORT', 10000))
+    web.run_app(create_web_app(), host='0.0.0.0', port=port, print=None)
+
+# ========== БЕНЧМАРК ==========
+# Легкие для БД команды: время уходит в основном на ответ Telegram
+BENCHMARK_MESSAGES = ('/start', '/help', '/activity', '/about', 'привет')
+
+def _start_fake_api(latency):
+    """Локальный Bot API: отвечает на любой метод через latency секунд"""
+    async def method(request):
+        await asyncio.sleep(latency)
+        return web.json_response({'ok': True, 'result': {
+            'message_id': 1, 'date': int(time.time()), 'text': 'ok',
+            'chat': {'id': 1, 'type': 'private'},
+        }})
+
+    sock = socket.socket()
+    sock.bind(('127.0.0.1', 0))
+    loop = asyncio.new_event_loop()
+
+    async def serve():
+        fake_app = web.Application()
+        fake_app.router.add_route('*', '/{path:.*}', method)
+        runner = web.AppRunner(fake_app, access_log=None)
+        await runner.setup()
+        await web.SockSite(runner, sock, backlog=4096).start()
+
+    loop.run_until_complete(serve())
+    threading.Thread(target=loop.run_forever, name='fake-bot-api', daemon=True).start()
+    return f"http://127.0.0.1:{sock.getsockname()[1]}/bot{{0}}/{{1}}"
+
+def _benchmark_bodies(count):
+    bodies = []
+    for i in range(count):
+        text = BENCHMARK_MESSAGES[i % len(BENCHMARK_MESSAGES)]
+        user = {'id': 900000000 + i, 'is_bot': False, 'first_name': 'Bench', 'username': f"bench_{i}"}
+        bodies.append(json.dumps({'update_id': i, 'message': {
+            'message_id': i, 'date': int(time.time()), 'text': text,
+            'chat': {'id': user['id'], 'type': 'private'}, 'from': user,
+        }}))
+    return bodies
+
+def _summary(latencies, elapsed):
+    latencies = sorted(latencies)
+    return {
+        'updates_per_sec': len(latencies) / elapsed,
+        'p50_ms': latencies[len(latencies) // 2] * 1000,
+        'p95_ms': latencies[int(len(latencies) * 0.95)] * 1000,
+    }
+
+def benchmark(count=2000, latency=0.1, threads=16):
+    """Пачка из count обновлений: синхронный режим с пулом threads потоков против asyncio.
+
+    Bot API подменяется локальным сервером с задержкой latency, чтобы
+    сравнивались рантаймы, а не сеть. Задержка — время от прихода пачки
+    до ответа на обновление.
+    """
+    api_url = _start_fake_api(latency)
+    telebot.apihelper.API_URL = api_url
+    asyncio_helper.API_URL = api_url
+    init_database()
+    bodies = _benchmark_bodies(count)
+
+    def sync_one(body, started):
+        token = log_context()
+        try:
+            process_update_sync(body)
+        finally:
+            reset_log_context(token)
+        return time.perf_counter() - started
+
+    with ThreadPoolExecutor(max_workers=threads) as pool:
+        started = time.perf_counter()
+        latencies = list(pool.map(lambda body: sync_one(body, started), bodies))
+        sync_result = _summary(latencies, time.perf_counter() - started)
+
+    async def run_async():
+        async def async_one(body, started):
+            token = log_context()
+            try:
+                await process_update(body)
+            finally:
+                reset_log_context(token)
+            return time.perf_counter() - started
+
+        started = time.perf_counter()
+        latencies = await asyncio.gather(*(async_one(body, started) for body in bodies))
+        result = _summary(latencies, time.perf_counter() - started)
+        await bot.close_session()
+        return result
+
+    return sync_result, asyncio.run(run_async())
+
+if __name__ == '__main__':
+    if sys.argv[1:2] == ['benchmark']:
+        # Команды пишутся в users/commands_log — только на отдельной БД (generate_dataset.py)
+        if 'DB_PATH' not in os.environ:
+            sys.exit("Укажите DB_PATH с тестовой БД: DB_PATH=data/load/bot_database.db python async_app.py benchmark")
+        logging.getLogger().setLevel(logging.WARNING)
+        for name, result in zip(('Синхронный', 'Asyncio'), benchmark()):
+            print(f"{name}: {result['updates_per_sec']:,.0f} обновлений/сек, "
+                  f"p50 {result['p50_ms']:.0f} мс, p95 {result['p95_ms']:.0f} мс")
+    else:
+        main()
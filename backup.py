@@ -0,0 +1,202 @@
+import os
+import shutil
+import sqlite3
+import threading
+import time
+from datetime import datetime
+
+GENERATION_FORMAT = '%Y%m%d-%H%M%S-%f'
+
+
+def copy_database(src_path, dst_path):
+    """Онлайн-копия через sqlite3 backup API за один шаг.
+
+    Копирование порциями начинается заново после каждой записи в
+    источник из другого соединения, и на занятом боте (каждая команда
+    пишет в commands_log) может не закончиться никогда. Один шаг читает
+    согласованный снимок; в режиме WAL писатели его не ждут.
+    """
+    src = sqlite3.connect(src_path, timeout=30)
+    dst = sqlite3.connect(dst_path)
+    try:
+        src.backup(dst)
+    finally:
+        dst.close()
+        src.close()
+
+
+def is_valid_database(path):
+    try:
+        conn = sqlite3.connect(f"file:{path}?mode=ro", uri=True)
+        try:
+            return conn.execute("PRAGMA quick_check").fetchone()[0] == 'ok'
+        finally:
+            conn.close()
+    except sqlite3.DatabaseError:
+        return False
+
+
+class DatabaseBackup:
+    """Резервные копии набора файлов SQLite (основная БД + шарды постов).
+
+    Каждое поколение — каталог backup_dir/<время> со всеми файлами.
+    Хранится не больше keep поколений; недописанные копии лежат в
+    .tmp-каталоге и не считаются поколением.
+    """
+
+    def __init__(self, paths, backup_dir, keep=5):
+        self.paths = list(paths)
+        self.backup_dir = backup_dir
+        self.keep = keep
+        self._lock = threading.Lock()
+        self.last_backup = None
+        self.last_duration = None
+
+    def generations(self):
+        """Каталоги поколений, от новых к старым"""
+        if not os.path.isdir(self.backup_dir):
+            return []
+        names = []
+        for name in os.listdir(self.backup_dir):
+            try:
+                datetime.strptime(name, GENERATION_FORMAT)
+            except ValueError:
+                continue
+            names.append(name)
+        return [os.path.join(self.backup_dir, name) for name in sorted(names, reverse=True)]
+
+    def backup(self):
+        """Новое поколение; возвращает путь к нему"""
+        with self._lock:
+            started = time.perf_counter()
+            name = datetime.now().strftime(GENERATION_FORMAT)
+            tmp_dir = os.path.join(self.backup_dir, f".tmp-{name}")
+            os.makedirs(tmp_dir, exist_ok=True)
+            try:
+                for path in self.paths:
+                    if not os.path.exists(path):
+                        continue
+                    target = os.path.join(tmp_dir, os.path.basename(path))
+                    copy_database(path, target)
+                    if not is_valid_database(target):
+                        raise sqlite3.DatabaseError(f"копия {target} повреждена")
+                generation = os.path.join(self.backup_dir, name)
+                os.rename(tmp_dir, generation)
+            except Exception:
+                shutil.rmtree(tmp_dir, ignore_errors=True)
+                raise
+
+            for old in self.generations()[self.keep:]:
+                shutil.rmtree(old, ignore_errors=True)
+
+            self.last_backup = datetime.now()
+            self.last_duration = time.perf_counter() - started
+            return generation
+
+    def restore(self, force=False):
+        """Восстановление из самого нового целого поколения.
+
+        Без force ничего не делает, если рабочие файлы уже есть — чтобы
+        не затереть более свежие данные. Возвращает путь к поколению или None.
+        """
+        if not force and any(os.path.exists(path) for path in self.paths):
+            return None
+
+        for generation in self.generations():
+            files = {
+                path: os.path.join(generation, os.path.basename(path))
+                for path in self.paths
+            }
+            present = {path: src for path, src in files.items() if os.path.exists(src)}
+            if not present or not all(is_valid_database(src) for src in present.values()):
+                continue
+
+            for path, src in present.items():
+                directory = os.path.dirname(path)
+                if directory:
+                    os.makedirs(directory, exist_ok=True)
+                tmp_path = f"{path}.restore"
+                shutil.copyfile(src, tmp_path)
+                for suffix in ('-wal', '-shm'):
+                    if os.path.exists(path + suffix):
+                        os.remove(path + suffix)
+                os.replace(tmp_path, path)
+            return generation
+        return None
+
+    def start(self, interval, on_error=None):
+        """Фоновые копии раз в interval секунд"""
+        def loop():
+            while True:
+                time.sleep(interval)
+                try:
+                    self.backup()
+                except Exception as e:
+                    if on_error:
+                        on_error(e)
+
+        thread = threading.Thread(target=loop, name='db-backup', daemon=True)
+        thread.start()
+        return thread
+
+
+def benchmark(directory, rows=2500000, write_interval=0.05):
+    """Время копирования (без нагрузки и под записью каждые write_interval с) и восстановления"""
+    db_path = os.path.join(directory, 'bench.db')
+    conn = sqlite3.connect(db_path)
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("CREATE TABLE commands_log (id INTEGER PRIMARY KEY, user_id INTEGER, command TEXT, executed_at TIMESTAMP)")
+    conn.executemany(
+        "INSERT INTO commands_log (user_id, command, executed_at) VALUES (?, ?, CURRENT_TIMESTAMP)",
+        ((i % 10000, f"/command_{i % 20}") for i in range(rows))
+    )
+    conn.commit()
+    conn.close()
+
+    size_mb = os.path.getsize(db_path) / 1024 / 1024
+    backups = DatabaseBackup([db_path], os.path.join(directory, 'backups'))
+    backups.backup()
+    backup_time = backups.last_duration
+
+    # Как на боте: другое соединение коммитит запись в commands_log
+    stop = threading.Event()
+    writes = []
+
+    def writer():
+        conn = sqlite3.connect(db_path, timeout=30)
+        while not stop.is_set():
+            started = time.perf_counter()
+            with conn:
+                conn.execute("INSERT INTO commands_log (user_id, command, executed_at) VALUES (1, '/start', CURRENT_TIMESTAMP)")
+            writes.append(time.perf_counter() - started)
+            time.sleep(write_interval)
+        conn.close()
+
+    thread = threading.Thread(target=writer)
+    thread.start()
+    try:
+        time.sleep(write_interval * 2)
+        backups.backup()
+    finally:
+        stop.set()
+        thread.join()
+    busy_backup_time = backups.last_duration
+    max_write = max(writes)
+
+    os.remove(db_path)
+    for suffix in ('-wal', '-shm'):
+        if os.path.exists(db_path + suffix):
+            os.remove(db_path + suffix)
+    started = time.perf_counter()
+    backups.restore()
+    restore_time = time.perf_counter() - started
+    return size_mb, backup_time, busy_backup_time, max_write, restore_time
+
+
+if __name__ == '__main__':
+    import tempfile
+
+    with tempfile.TemporaryDirectory() as tmp:
+        size_mb, backup_time, busy_backup_time, max_write, restore_time = benchmark(tmp)
+        print(f"БД {size_mb:.1f} МБ: бэкап {backup_time:.2f} с, восстановление {restore_time:.2f} с")
+        print(f"Бэкап под записью: {busy_backup_time:.2f} с, самая долгая запись {max_write * 1000:.0f} мс")
@@ -0,0 +1,261 @@
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+BROADCASTS_SCHEMA = '''
+    CREATE TABLE IF NOT EXISTS broadcasts (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        admin_id INTEGER NOT NULL,
+        chat_id INTEGER NOT NULL,
+        progress_message_id INTEGER,
+        text TEXT NOT NULL,
+        status TEXT NOT NULL DEFAULT 'running',
+        last_user_id INTEGER NOT NULL DEFAULT 0,
+        total INTEGER NOT NULL DEFAULT 0,
+        sent INTEGER NOT NULL DEFAULT 0,
+        failed INTEGER NOT NULL DEFAULT 0,
+        blocked INTEGER NOT NULL DEFAULT 0,
+        started_at INTEGER,
+        updated_at INTEGER,
+        finished_at INTEGER
+    )
+'''
+
+# Ошибки Telegram, после которых пользователю писать бесполезно
+BLOCKED_DESCRIPTIONS = (
+    'bot was blocked by the user',
+    'user is deactivated',
+    'chat not found',
+    'bot was kicked',
+    'bot can\'t initiate conversation',
+)
+
+
+def init_broadcast_tables(conn):
+    """Таблица рассылок и пометка заблокировавших бота пользователей"""
+    conn.execute(BROADCASTS_SCHEMA)
+    columns = [row[1] for row in conn.execute("PRAGMA table_info(users)")]
+    if 'is_blocked' not in columns:
+        conn.execute("ALTER TABLE users ADD COLUMN is_blocked INTEGER NOT NULL DEFAULT 0")
+    conn.commit()
+
+
+def classify_error(error):
+    """'blocked' | 'retry' | 'failed' и пауза перед повтором для 429"""
+    code = getattr(error, 'error_code', None)
+    description = (getattr(error, 'description', None) or str(error)).lower()
+    if code == 429:
+        parameters = (getattr(error, 'result_json', None) or {}).get('parameters') or {}
+        return 'retry', parameters.get('retry_after', 1)
+    if code in (400, 403) and any(text in description for text in BLOCKED_DESCRIPTIONS):
+        return 'blocked', 0
+    return 'failed', 0
+
+
+class RateLimiter:
+    """Общий бюджет отправки: не больше rate сообщений в секунду на все рассылки"""
+
+    def __init__(self, rate):
+        self.interval = 1.0 / rate
+        self._lock = threading.Lock()
+        self._next = time.monotonic()
+
+    def acquire(self):
+        with self._lock:
+            now = time.monotonic()
+            wait = self._next - now
+            self._next = max(now, self._next) + self.interval
+        if wait > 0:
+            time.sleep(wait)
+
+    def pause(self, seconds):
+        """После 429 сдвинуть бюджет для всех отправителей"""
+        with self._lock:
+            self._next = max(self._next, time.monotonic() + seconds)
+
+
+class BroadcastEngine:
+    """Рассылка по таблице users с контрольными точками в SQLite.
+
+    Получатели читаются страницами по user_id (keyset, без OFFSET), каждая
+    страница отправляется пулом из concurrency потоков под общим
+    RateLimiter. После страницы в broadcasts фиксируется last_user_id и
+    счетчики, поэтому после перезапуска рассылка продолжается со
+    следующей страницы (повторно может уйти только недописанная страница).
+    """
+
+    def __init__(self, connect, send, rate=25, concurrency=8, page_size=100,
+                 progress_interval=5.0, on_progress=None, on_error=None, clock=time.time):
+        self.connect = connect
+        self.send = send
+        self.limiter = RateLimiter(rate)
+        self.concurrency = concurrency
+        self.page_size = page_size
+        self.progress_interval = progress_interval
+        self.on_progress = on_progress
+        self.on_error = on_error
+        self.clock = clock
+        self._lock = threading.Lock()
+        self._running = {}
+
+    # ---------- Управление ----------
+    def start(self, admin_id, chat_id, text, progress_message_id=None):
+        conn = self.connect()
+        try:
+            now = int(self.clock())
+            total = conn.execute("SELECT COUNT(*) FROM users WHERE is_blocked = 0").fetchone()[0]
+            cursor = conn.execute('''
+                INSERT INTO broadcasts (admin_id, chat_id, progress_message_id, text, total, started_at, updated_at)
+                VALUES (?, ?, ?, ?, ?, ?, ?)
+            ''', (admin_id, chat_id, progress_message_id, text, total, now, now))
+            conn.commit()
+            broadcast_id = cursor.lastrowid
+        finally:
+            conn.close()
+        self._spawn(broadcast_id)
+        return broadcast_id
+
+    def resume_pending(self):
+        """Продолжить рассылки, прерванные перезапуском"""
+        conn = self.connect()
+        try:
+            ids = [row[0] for row in conn.execute("SELECT id FROM broadcasts WHERE status = 'running'")]
+        finally:
+            conn.close()
+        for broadcast_id in ids:
+            self._spawn(broadcast_id)
+        return ids
+
+    def cancel(self, broadcast_id):
+        conn = self.connect()
+        try:
+            cursor = conn.execute(
+                "UPDATE broadcasts SET status = 'cancelled', finished_at = ? WHERE id = ? AND status = 'running'",
+                (int(self.clock()), broadcast_id)
+            )
+            conn.commit()
+            return cursor.rowcount > 0
+        finally:
+            conn.close()
+
+    def get(self, broadcast_id=None):
+        """Рассылка по id или последняя"""
+        conn = self.connect()
+        try:
+            if broadcast_id is None:
+                row = conn.execute("SELECT * FROM broadcasts ORDER BY id DESC LIMIT 1").fetchone()
+            else:
+                row = conn.execute("SELECT * FROM broadcasts WHERE id = ?", (broadcast_id,)).fetchone()
+            return dict(row) if row else None
+        finally:
+            conn.close()
+
+    def _spawn(self, broadcast_id):
+        with self._lock:
+            if broadcast_id in self._running:
+                return
+            thread = threading.Thread(target=self._run, args=(broadcast_id,), name=f"broadcast-{broadcast_id}", daemon=True)
+            self._running[broadcast_id] = thread
+        thread.start()
+
+    # ---------- Отправка ----------
+    def _send_one(self, user_id, text):
+        for _ in range(5):
+            self.limiter.acquire()
+            try:
+                self.send(user_id, text)
+                return 'sent'
+            except Exception as e:
+                outcome, retry_after = classify_error(e)
+                if outcome != 'retry':
+                    return outcome
+                self.limiter.pause(retry_after)
+        return 'failed'
+
+    def _run(self, broadcast_id):
+        started = time.monotonic()
+        sent_at_start = None
+        last_progress = 0.0
+        try:
+            with ThreadPoolExecutor(max_workers=self.concurrency, thread_name_prefix=f"broadcast-{broadcast_id}") as pool:
+                while True:
+                    job = self.get(broadcast_id)
+                    if job is None or job['status'] != 'running':
+                        break
+                    if sent_at_start is None:
+                        sent_at_start = job['sent'] + job['failed'] + job['blocked']
+
+                    conn = self.connect()
+                    try:
+                        recipients = [row[0] for row in conn.execute('''
+                            SELECT user_id FROM users
+                            WHERE user_id > ? AND is_blocked = 0
+                            ORDER BY user_id
+                            LIMIT ?
+                        ''', (job['last_user_id'], self.page_size))]
+                    finally:
+                        conn.close()
+
+                    if not recipients:
+                        self._checkpoint(broadcast_id, job['last_user_id'], [], 0, 0, status='done')
+                        break
+
+                    outcomes = list(pool.map(lambda user_id: self._send_one(user_id, job['text']), recipients))
+                    blocked = [user_id for user_id, outcome in zip(recipients, outcomes) if outcome == 'blocked']
+                    self._checkpoint(
+                        broadcast_id,
+                        recipients[-1],
+                        blocked,
+                        outcomes.count('sent'),
+                        outcomes.count('failed'),
+                    )
+
+                    if self.on_progress and time.monotonic() - last_progress >= self.progress_interval:
+                        last_progress = time.monotonic()
+                        self.on_progress(self.progress(broadcast_id, started, sent_at_start))
+
+            if self.on_progress:
+                self.on_progress(self.progress(broadcast_id, started, sent_at_start))
+        except Exception as e:
+            if self.on_error:
+                self.on_error(broadcast_id, e)
+        finally:
+            with self._lock:
+                self._running.pop(broadcast_id, None)
+
+    def _checkpoint(self, broadcast_id, last_user_id, blocked, sent, failed, status='running'):
+        """Одна транзакция: прогресс рассылки и пометка заблокировавших бота"""
+        now = int(self.clock())
+        conn = self.connect()
+        try:
+            with conn:
+                if blocked:
+                    conn.execute(
+                        f"UPDATE users SET is_blocked = 1 WHERE user_id IN ({', '.join('?' * len(blocked))})",
+                        blocked
+                    )
+                conn.execute('''
+                    UPDATE broadcasts
+                    SET last_user_id = ?, sent = sent + ?, failed = failed + ?, blocked = blocked + ?,
+                        updated_at = ?,
+                        status = CASE WHEN status = 'running' THEN ? ELSE status END,
+                        finished_at = CASE WHEN ? = 'done' THEN ? ELSE finished_at END
+                    WHERE id = ?
+                ''', (last_user_id, sent, failed, len(blocked), now, status, status, now, broadcast_id))
+        finally:
+            conn.close()
+
+    def progress(self, broadcast_id, started=None, processed_at_start=0):
+        """Состояние рассылки с оценкой оставшегося времени (секунды)"""
+        job = self.get(broadcast_id)
+        if job is None:
+            return None
+        processed = job['sent'] + job['failed'] + job['blocked']
+        job['processed'] = processed
+        job['eta'] = None
+        if started is not None and job['status'] == 'running':
+            elapsed = time.monotonic() - started
+            done_now = processed - (processed_at_start or 0)
+            if done_now > 0 and elapsed > 0:
+                job['eta'] = max(0, job['total'] - processed) / (done_now / elapsed)
+        return job
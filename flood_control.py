@@ -0,0 +1,129 @@
+import threading
+import time
+
+
+class TokenBucket:
+    """Корзина токенов: capacity запросов, пополнение rate токенов в секунду"""
+
+    __slots__ = ('capacity', 'rate', 'tokens', 'updated')
+
+    def __init__(self, capacity, period, now):
+        self.capacity = float(capacity)
+        self.rate = capacity / float(period)
+        self.tokens = float(capacity)
+        self.updated = now
+
+    def refill(self, now):
+        elapsed = now - self.updated
+        if elapsed > 0:
+            self.tokens = min(self.capacity, self.tokens + elapsed * self.rate)
+            self.updated = now
+
+    def consume(self, now):
+        self.refill(now)
+        if self.tokens >= 1:
+            self.tokens -= 1
+            return True
+        return False
+
+    def idle_full(self, now):
+        """Корзина уже полностью восстановилась — её можно забыть"""
+        return (now - self.updated) * self.rate + self.tokens >= self.capacity
+
+
+class FloodControl:
+    """Ограничение частоты запросов по пользователю и по отдельным командам.
+
+    user_limit и command_limits задаются как (запросов, за_секунд).
+    Каждое сообщение списывает токен из общей корзины пользователя,
+    команды из command_limits — дополнительно из своей корзины.
+    """
+
+    def __init__(self, user_limit=(20, 60), command_limits=None, exempt_ids=(),
+                 notify_interval=30, cleanup_every=1000, clock=time.monotonic):
+        self.user_limit = user_limit
+        self.command_limits = dict(command_limits or {})
+        self.exempt_ids = set(exempt_ids)
+        self.notify_interval = notify_interval
+        self.cleanup_every = cleanup_every
+        self.clock = clock
+
+        self._lock = threading.Lock()
+        self._buckets = {}
+        self._notified = {}
+        self._checks = 0
+
+        self.counters = {
+            'allowed': 0,
+            'throttled': 0,
+            'exempt': 0,
+            'notified': 0,
+        }
+        self.throttled_by_key = {}
+
+    def _bucket(self, user_id, key, limit, now):
+        bucket = self._buckets.get((user_id, key))
+        if bucket is None:
+            bucket = TokenBucket(limit[0], limit[1], now)
+            self._buckets[(user_id, key)] = bucket
+        return bucket
+
+    def _throttle(self, key):
+        self.counters['throttled'] += 1
+        self.throttled_by_key[key] = self.throttled_by_key.get(key, 0) + 1
+        return False
+
+    def check(self, user_id, command=None):
+        """True — запрос можно обрабатывать, False — запрос нужно отбросить"""
+        if user_id in self.exempt_ids:
+            with self._lock:
+                self.counters['exempt'] += 1
+            return True
+
+        with self._lock:
+            now = self.clock()
+            self._checks += 1
+            if self._checks % self.cleanup_every == 0:
+                self._cleanup(now)
+
+            user_bucket = self._bucket(user_id, None, self.user_limit, now)
+            user_bucket.refill(now)
+            if user_bucket.tokens < 1:
+                return self._throttle('user')
+
+            limit = self.command_limits.get(command)
+            if limit is not None:
+                if not self._bucket(user_id, command, limit, now).consume(now):
+                    return self._throttle(command)
+
+            user_bucket.tokens -= 1
+            self.counters['allowed'] += 1
+            return True
+
+    def should_notify(self, user_id):
+        """Отвечать об ограничении не чаще раза в notify_interval секунд"""
+        with self._lock:
+            now = self.clock()
+            last = self._notified.get(user_id)
+            if last is not None and now - last < self.notify_interval:
+                return False
+            self._notified[user_id] = now
+            self.counters['notified'] += 1
+            return True
+
+    def _cleanup(self, now):
+        for key in [k for k, b in self._buckets.items() if b.idle_full(now)]:
+            del self._buckets[key]
+        for user_id in [u for u, t in self._notified.items() if now - t >= self.notify_interval]:
+            del self._notified[user_id]
+
+    def stats(self):
+        """Снимок счетчиков для API"""
+        with self._lock:
+            return {
+                **self.counters,
+                'throttled_by_key': {str(k): v for k, v in self.throttled_by_key.items()},
+                'tracked_buckets': len(self._buckets),
+                'user_limit': list(self.user_limit),
+                'command_limits': {k: list(v) for k, v in self.command_limits.items()},
+            }
@@ -0,0 +1,346 @@
+"""Генератор синтетической БД для нагрузочного тестирования.
+
+Пример в масштабе продакшена:
+
+    python generate_dataset.py --db data/load/bot_database.db --shards 8 \\
+        --channels 10000 --posts 50000000 --users 1000000 --commands 100000000
+
+Распределения скошенные: популярность каналов и активность пользователей —
+степенные, просмотры — логнормальные. При одинаковом --seed получается
+одинаковая БД. Основная БД и каждый шард заполняются в отдельных
+процессах большими транзакциями с отключенным журналом; индексы
+строятся после загрузки. --bench замеряет обработчики /top, /stats,
+/channels, /activity и Flask-маршруты app.py на готовой БД.
+"""
+import argparse
+import json
+import math
+import os
+import random
+import sqlite3
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+from activity import migrate_main, migrate_shard
+from broadcast import init_broadcast_tables
+from storage import MAIN_SCHEMA, POSTS_SCHEMA, ShardedPostStorage
+
+DAY = 86400
+
+COMMANDS = (
+    ('/top', 25), ('/stats', 15), ('/start', 10), ('/channels', 10), ('TEXT: привет', 12),
+    ('/trending', 8), ('/myinfo', 6), ('/help', 5), ('/activity', 5), ('/report', 4),
+)
+
+# Доля активности по часам суток (UTC): ночью тише, вечером пик
+HOUR_WEIGHTS = (2, 1, 1, 1, 1, 2, 3, 5, 7, 8, 8, 8, 9, 9, 8, 8, 9, 10, 12, 13, 12, 9, 6, 4)
+
+EMOJIS = ('👍', '❤️', '🔥', '🎯', '😂', '😢')
+
+TOPICS = (
+    "Новое исследование в области машинного обучения",
+    "Стартап привлек инвестиции",
+    "Искусственный интеллект в медицине",
+    "Технологии будущего",
+    "Как создать успешный продукт",
+    "Цифровая трансформация бизнеса",
+    "Тенденции развития ИИ",
+    "Кибербезопасность в современном мире",
+    "Облачные технологии",
+    "Мобильная разработка: тренды",
+)
+
+
+def bulk_connect(path):
+    """Соединение для загрузки: без журнала и fsync, большой кэш"""
+    conn = sqlite3.connect(path, isolation_level=None)
+    conn.execute("PRAGMA journal_mode=OFF")
+    conn.execute("PRAGMA synchronous=OFF")
+    conn.execute("PRAGMA cache_size=-262144")
+    conn.execute("PRAGMA temp_store=MEMORY")
+    conn.execute("PRAGMA locking_mode=EXCLUSIVE")
+    return conn
+
+
+def bulk_insert(conn, sql, rows, chunk=50000, transaction_rows=1000000):
+    """executemany порциями, COMMIT раз в transaction_rows строк"""
+    inserted = 0
+    buffer = []
+    conn.execute("BEGIN")
+    for row in rows:
+        buffer.append(row)
+        if len(buffer) >= chunk:
+            conn.executemany(sql, buffer)
+            inserted += len(buffer)
+            buffer = []
+            if inserted % transaction_rows < chunk:
+                conn.execute("COMMIT")
+                conn.execute("BEGIN")
+    if buffer:
+        conn.executemany(sql, buffer)
+        inserted += len(buffer)
+    conn.execute("COMMIT")
+    return inserted
+
+
+def channel_plan(channels, posts, zipf_s=1.1):
+    """[(номер канала, число постов, медиана просмотров)] по закону Ципфа"""
+    weights = [1.0 / (rank + 1) ** zipf_s for rank in range(channels)]
+    total_weight = sum(weights)
+    counts = [int(posts * w / total_weight) for w in weights]
+    for i in range(posts - sum(counts)):
+        counts[i % channels] += 1
+    return [
+        (i, counts[i], 50 + 200000 * weights[i] / weights[0])
+        for i in range(channels)
+    ]
+
+
+def channel_id(index):
+    return f"@channel_{index:05d}"
+
+
+# ---------- Шарды постов ----------
+def generate_posts(rng, plan, now, days):
+    updated_at = time.strftime('%Y-%m-%d %H:%M:%S', time.gmtime(now))
+    for index, count, median_views in plan:
+        if not count:
+            continue
+        cid = channel_id(index)
+        mu = math.log(median_views)
+        emoji_weights = [rng.random() ** 2 for _ in EMOJIS]
+        gap = days * DAY / count
+        posted = now - days * DAY
+        for post_id in range(1, count + 1):
+            posted += rng.expovariate(1.0 / gap)
+            age = max(1.0, now - posted)
+            views = int(rng.lognormvariate(mu, 0.8) * min(1.0, (age / (2 * DAY)) ** 0.5))
+            forwards = int(views * rng.betavariate(1.2, 300))
+
+            reactions = {}
+            total_reactions = int(views * rng.uniform(0.002, 0.02))
+            if total_reactions:
+                for emoji, weight in zip(EMOJIS, emoji_weights):
+                    value = int(total_reactions * weight * rng.uniform(0.5, 1.5))
+                    if value:
+                        reactions[emoji] = value
+
+            yield (
+                cid,
+                post_id,
+                f"{TOPICS[post_id % len(TOPICS)]} (Пост #{post_id})",
+                views,
+                forwards,
+                json.dumps(reactions),
+                int(min(posted, now)),
+                updated_at,
+            )
+
+
+def load_shard(db_path, shard_count, shard, plan, seed, now, days):
+    storage = ShardedPostStorage(db_path, shard_count)
+    conn = bulk_connect(storage.paths[shard])
+    conn.execute(POSTS_SCHEMA)
+    rng = random.Random(f"{seed}:shard:{shard}")
+    inserted = bulk_insert(conn, '''
+        INSERT INTO posts (channel_id, post_id, message_text, views, forwards, reactions, post_date, updated_at)
+        VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+    ''', generate_posts(rng, plan, now, days))
+    conn.close()
+    return f"шард {shard}", inserted
+
+
+# ---------- Основная БД ----------
+def generate_users(rng, users, now):
+    for i in range(users):
+        joined = now - int(rng.uniform(0, 730) * DAY)
+        # Большинство заходило недавно, хвост — давно неактивные
+        last_activity = joined + int((now - joined) * (1 - rng.random() ** 3))
+        yield (100000000 + i, f"user_{i}", f"User {i}", joined, last_activity, 1 if rng.random() < 0.02 else 0)
+
+
+def generate_commands(rng, commands, users, now, days, skew):
+    names = [name for name, _ in COMMANDS]
+    command_weights = list(_cumulative(weight for _, weight in COMMANDS))
+    hour_weights = list(_cumulative(HOUR_WEIGHTS))
+    hours = list(range(24))
+    for _ in range(commands):
+        # random() ** skew: немногие пользователи дают большую часть команд
+        user_id = 100000000 + int(users * rng.random() ** skew)
+        day_start = now - (now % DAY) - rng.randrange(days) * DAY
+        hour = rng.choices(hours, cum_weights=hour_weights)[0]
+        executed_at = min(now, day_start + hour * 3600 + rng.randrange(3600))
+        yield (user_id, rng.choices(names, cum_weights=command_weights)[0], executed_at)
+
+
+def _cumulative(values):
+    total = 0
+    for value in values:
+        total += value
+        yield total
+
+
+def load_main(db_path, channels, users, commands, seed, now, log_days, activity_skew):
+    conn = bulk_connect(db_path)
+    for sql in MAIN_SCHEMA:
+        conn.execute(sql)
+    init_broadcast_tables(conn)
+    rng = random.Random(f"{seed}:main")
+
+    bulk_insert(conn, '''
+        INSERT INTO channels (channel_id, channel_name, username, added_date, is_active)
+        VALUES (?, ?, ?, ?, ?)
+    ''', (
+        (
+            channel_id(i),
+            f"Канал {i}",
+            channel_id(i)[1:],
+            time.strftime('%Y-%m-%d %H:%M:%S', time.gmtime(now - rng.randrange(365 * DAY))),
+            0 if rng.random() < 0.05 else 1,
+        )
+        for i in range(channels)
+    ))
+    bulk_insert(conn, '''
+        INSERT INTO users (user_id, username, first_name, join_date, last_activity, is_blocked)
+        VALUES (?, ?, ?, ?, ?, ?)
+    ''', generate_users(rng, users, now))
+    inserted = bulk_insert(conn, '''
+        INSERT INTO commands_log (user_id, command, executed_at) VALUES (?, ?, ?)
+    ''', generate_commands(rng, commands, max(1, users), now, log_days, activity_skew))
+    conn.close()
+    return "основная БД", channels + users + inserted
+
+
+# ---------- Замеры ----------
+def run_benchmarks(db_path, shard_count, timezone_name='UTC', repeat=5):
+    """Время (мс) обработчиков команд и Flask-маршрутов app.py на готовой БД.
+
+    app импортируется с DB_PATH/POST_SHARDS, указывающими на
+    сгенерированную БД, поэтому замеряется тот же код, что у бота:
+    запросы, сборка текста и листание страниц. В БД ничего не пишется.
+    """
+    os.environ['DB_PATH'] = db_path
+    os.environ['POST_SHARDS'] = str(shard_count)
+    os.environ['BOT_TIMEZONE'] = timezone_name
+    import logging
+    import telebot
+    import app
+
+    logging.getLogger().setLevel(logging.WARNING)
+    client = app.app.test_client()
+    user = {'id': 100000000, 'is_bot': False, 'first_name': 'Bench'}
+
+    def message(text):
+        return telebot.types.Message.de_json({
+            'message_id': 1, 'date': int(time.time()), 'text': text,
+            'chat': {'id': user['id'], 'type': 'private'}, 'from': user,
+        })
+
+    def next_page(reply):
+        """Нажатие «Вперед» под первой страницей ответа"""
+        markup = reply.get('reply_markup')
+        if markup is None:
+            return None
+        return telebot.types.CallbackQuery.de_json({
+            'id': '1', 'chat_instance': 'bench', 'from': user,
+            'data': markup.keyboard[0][-1].callback_data,
+            'message': {'message_id': 2, 'date': 0, 'chat': {'id': user['id'], 'type': 'private'}, 'text': ''},
+        })
+
+    call = next_page(app.top_reply(message('/top 100')))
+
+    cases = (
+        ('/top', lambda: app.top_reply(message('/top'))),
+        ('/top 100 → стр. 2', lambda: call and app.page_callback_reply(call)),
+        ('/stats', lambda: app.stats_reply(message('/stats'))),
+        ('/channels', lambda: app.channels_reply(message('/channels'))),
+        ('/activity hour 168', lambda: app.activity_reply(message('/activity hour 168'))),
+        ('/myinfo', lambda: app.myinfo_reply(message('/myinfo'))),
+        ('GET /api/stats', lambda: client.get('/api/stats')),
+        ('GET /api/activity', lambda: client.get('/api/activity?unit=hour&range=168')),
+    )
+    results = {}
+    for name, fn in cases:
+        timings = []
+        for _ in range(repeat):
+            started = time.perf_counter()
+            fn()
+            timings.append((time.perf_counter() - started) * 1000)
+        results[name] = min(timings)
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Синтетическая БД для нагрузочного тестирования")
+    parser.add_argument('--db', default='data/load/bot_database.db', help="путь к основной БД")
+    parser.add_argument('--shards', type=int, default=4, help="число шардов постов (как POST_SHARDS)")
+    parser.add_argument('--channels', type=int, default=1000)
+    parser.add_argument('--posts', type=int, default=1000000)
+    parser.add_argument('--users', type=int, default=100000)
+    parser.add_argument('--commands', type=int, default=1000000)
+    parser.add_argument('--post-days', type=int, default=365, help="за сколько дней генерировать посты")
+    parser.add_argument('--log-days', type=int, default=90, help="за сколько дней генерировать журнал команд")
+    parser.add_argument('--activity-skew', type=float, default=3.0, help="скошенность активности пользователей")
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--now', type=int, default=None, help="«текущее» время (Unix) для воспроизводимости")
+    parser.add_argument('--force', action='store_true', help="перезаписать существующие файлы")
+    parser.add_argument('--bench', action='store_true', help="после генерации замерить обработчики app.py")
+    parser.add_argument('--bench-only', action='store_true', help="только замерить обработчики на готовой БД")
+    args = parser.parse_args()
+
+    storage = ShardedPostStorage(args.db, args.shards)
+    paths = [args.db] + storage.paths
+
+    if not args.bench_only:
+        existing = [path for path in paths if os.path.exists(path)]
+        if existing and not args.force:
+            parser.error(f"файлы уже существуют: {', '.join(existing)} (используйте --force)")
+        for path in existing:
+            os.remove(path)
+        directory = os.path.dirname(args.db)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+
+        now = args.now or int(time.time())
+        plan = channel_plan(args.channels, args.posts)
+        by_shard = [[] for _ in range(args.shards)]
+        for entry in plan:
+            by_shard[storage.shard_for(channel_id(entry[0]))].append(entry)
+
+        started = time.perf_counter()
+        with ProcessPoolExecutor(max_workers=min(os.cpu_count() or 1, args.shards + 1)) as pool:
+            jobs = [pool.submit(load_main, args.db, args.channels, args.users, args.commands,
+                                args.seed, now, args.log_days, args.activity_skew)]
+            jobs += [
+                pool.submit(load_shard, args.db, args.shards, shard, by_shard[shard], args.seed, now, args.post_days)
+                for shard in range(args.shards)
+            ]
+            for job in jobs:
+                name, rows = job.result()
+                print(f"✅ {name}: {rows:,} строк")
+        print(f"⏱ Загрузка: {time.perf_counter() - started:.1f} с")
+
+        # Индексы после загрузки — одна сортировка вместо вставок в B-дерево
+        started = time.perf_counter()
+        conn = sqlite3.connect(args.db)
+        migrate_main(conn)
+        storage.check_shard_count(conn)
+        conn.close()
+        storage.init()
+        for shard in range(args.shards):
+            conn = storage.connect(shard)
+            migrate_shard(conn)
+            conn.execute("ANALYZE")
+            conn.close()
+        conn = sqlite3.connect(args.db)
+        conn.execute("ANALYZE")
+        conn.close()
+        print(f"⏱ Индексы: {time.perf_counter() - started:.1f} с")
+
+    if args.bench or args.bench_only:
+        for name, ms in run_benchmarks(args.db, args.shards).items():
+            print(f"{name}: {ms:.1f} мс")
+
+
+if __name__ == '__main__':
+    main()
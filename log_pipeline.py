@@ -0,0 +1,204 @@
+import contextvars
+import json
+import logging
+import os
+import queue
+import random
+import sys
+import time
+from datetime import datetime, timezone
+from logging.handlers import QueueHandler, QueueListener
+
+STRUCTURED_FIELDS = ('update_id', 'user_id', 'command', 'kind', 'duration_ms')
+
+_log_context = contextvars.ContextVar('log_context', default=None)
+
+
+def log_context(**fields):
+    """Начать контекст обновления; вернуть токен для reset_log_context"""
+    return _log_context.set(dict(fields))
+
+
+def reset_log_context(token):
+    _log_context.reset(token)
+
+
+def bind(**fields):
+    """Добавить поля в контекст текущего обновления (если он есть)"""
+    context = _log_context.get()
+    if context is not None:
+        context.update(fields)
+
+
+class ContextFilter(logging.Filter):
+    """Переносит поля контекста обновления в запись лога"""
+
+    def filter(self, record):
+        context = _log_context.get()
+        if context:
+            for key, value in context.items():
+                if not hasattr(record, key):
+                    setattr(record, key, value)
+        return True
+
+
+class SamplingFilter(logging.Filter):
+    """Пропускает только долю rate записей от шумных логгеров"""
+
+    def __init__(self, rate, logger_names):
+        super().__init__()
+        self.rate = rate
+        self.logger_names = frozenset(logger_names)
+        self.sampled_out = 0
+
+    def filter(self, record):
+        if record.name in self.logger_names and random.random() >= self.rate:
+            self.sampled_out += 1
+            return False
+        return True
+
+
+class DropCountingQueueHandler(QueueHandler):
+    """QueueHandler, который не ждет при переполнении очереди, а считает потери"""
+
+    def __init__(self, log_queue):
+        super().__init__(log_queue)
+        self.dropped = 0
+
+    def prepare(self, record):
+        # Без copy.copy и форматирования: в потоке запроса только подставляем аргументы,
+        # JSON собирается в потоке QueueListener
+        record.msg = record.getMessage()
+        record.args = None
+        if record.exc_info:
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+            record.exc_info = None
+        return record
+
+    def enqueue(self, record):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+
+class JsonFormatter(logging.Formatter):
+    """Одна JSON-строка на запись"""
+
+    def format(self, record):
+        entry = {
+            'ts': datetime.fromtimestamp(record.created, timezone.utc).isoformat(timespec='milliseconds'),
+            'level': record.levelname,
+            'logger': record.name,
+            'message': record.getMessage(),
+        }
+        for key in STRUCTURED_FIELDS:
+            value = getattr(record, key, None)
+            if value is not None:
+                entry[key] = value
+        if record.exc_text:
+            entry['exc'] = record.exc_text
+        return json.dumps(entry, ensure_ascii=False, default=str)
+
+
+class LoggingPipeline:
+    """Логи пишутся в фоновом потоке: обработчики запросов только кладут запись в очередь"""
+
+    def __init__(self, stream=None, level=logging.INFO, queue_size=10000,
+                 sample_rate=0.01, sampled_loggers=('webhook.raw',)):
+        self.level = level
+        self.queue = queue.Queue(maxsize=queue_size)
+
+        self.queue_handler = DropCountingQueueHandler(self.queue)
+        self.sampling = SamplingFilter(sample_rate, sampled_loggers)
+        self.queue_handler.addFilter(self.sampling)
+        self.queue_handler.addFilter(ContextFilter())
+
+        self.output = logging.StreamHandler(stream or sys.stderr)
+        self.output.setFormatter(JsonFormatter())
+        self.listener = QueueListener(self.queue, self.output, respect_handler_level=False)
+
+    def start(self):
+        root = logging.getLogger()
+        for handler in list(root.handlers):
+            root.removeHandler(handler)
+        root.addHandler(self.queue_handler)
+        root.setLevel(self.level)
+        self.listener.start()
+        return self
+
+    def stop(self):
+        logging.getLogger().removeHandler(self.queue_handler)
+        self.listener.stop()
+
+    def stats(self):
+        return {
+            'queued': self.queue.qsize(),
+            'dropped': self.queue_handler.dropped,
+            'sampled_out': self.sampling.sampled_out,
+            'sample_rate': self.sampling.rate,
+        }
+
+
+class _SlowStream:
+    """Поток вывода, который отвечает с задержкой — как stderr, упершийся в переполненный pipe"""
+
+    def __init__(self, delay):
+        self.delay = delay
+
+    def write(self, text):
+        time.sleep(self.delay)
+
+    def flush(self):
+        pass
+
+
+def benchmark(iterations=20000, slow_delay=0.0002):
+    """Средняя задержка обработчика (мкс) с логированием и без"""
+    def handler(log):
+        token = log_context(update_id=1)
+        try:
+            bind(user_id=42, command='/stats')
+            log.info("📨 Команда от 42: /stats")
+            logging.getLogger('webhook.raw').info("📥 Вебхук получен: %s", '{"update_id": 1}' * 10)
+        finally:
+            reset_log_context(token)
+
+    def measure():
+        log = logging.getLogger('bench')
+        started = time.perf_counter()
+        for _ in range(iterations):
+            handler(log)
+        return (time.perf_counter() - started) / iterations * 1e6
+
+    root = logging.getLogger()
+    saved_handlers, saved_level = root.handlers[:], root.level
+    results = {}
+    try:
+        logging.disable(logging.CRITICAL)
+        results['disabled'] = measure()
+        logging.disable(logging.NOTSET)
+
+        for name, stream in (('devnull', open(os.devnull, 'w')), ('slow', _SlowStream(slow_delay))):
+            for handler_ in list(root.handlers):
+                root.removeHandler(handler_)
+            sync = logging.StreamHandler(stream)
+            sync.setFormatter(logging.Formatter('%(asctime)s - %(name)s - %(levelname)s - %(message)s'))
+            root.addHandler(sync)
+            root.setLevel(logging.INFO)
+            results[f'sync/{name}'] = measure()
+            root.removeHandler(sync)
+
+            pipeline = LoggingPipeline(stream=stream, queue_size=iterations * 2).start()
+            results[f'queue/{name}'] = measure()
+            pipeline.stop()
+    finally:
+        logging.disable(logging.NOTSET)
+        root.handlers[:] = saved_handlers
+        root.setLevel(saved_level)
+    return results
+
+
+if __name__ == '__main__':
+    for mode, latency in benchmark().items():
+        print(f"{mode}: {latency:.1f} мкс на обработчик")
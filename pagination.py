@@ -0,0 +1,67 @@
+import itertools
+import threading
+import time
+from collections import OrderedDict
+
+
+class ResultCursors:
+    """Упорядоченные списки id результатов для листания страниц.
+
+    Запрос с сортировкой выполняется один раз при команде; кнопки
+    «вперед/назад» берут срез списка и достают только строки страницы.
+    Курсор привязан к чату, живет ttl секунд, всего хранится не больше
+    max_entries курсоров.
+    """
+
+    def __init__(self, ttl=600, max_entries=1000, clock=time.monotonic):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.clock = clock
+        self._lock = threading.Lock()
+        self._cursors = OrderedDict()
+        self._tokens = itertools.count(1)
+
+    def create(self, chat_id, kind, ids, page_size):
+        """Сохранить результат, вернуть короткий токен для callback_data"""
+        with self._lock:
+            now = self.clock()
+            self._prune(now)
+            token = format(next(self._tokens), 'x')
+            self._cursors[token] = {
+                'chat_id': chat_id,
+                'kind': kind,
+                'ids': list(ids),
+                'page_size': page_size,
+                'expires': now + self.ttl,
+            }
+            while len(self._cursors) > self.max_entries:
+                self._cursors.popitem(last=False)
+            return token
+
+    def get(self, chat_id, token):
+        with self._lock:
+            cursor = self._cursors.get(token)
+            if cursor is None or cursor['chat_id'] != chat_id:
+                return None
+            if cursor['expires'] <= self.clock():
+                del self._cursors[token]
+                return None
+            return cursor
+
+    def _prune(self, now):
+        # Курсоры создаются по порядку, а ttl одинаковый — просроченные идут первыми
+        while self._cursors:
+            token, cursor = next(iter(self._cursors.items()))
+            if cursor['expires'] > now:
+                break
+            del self._cursors[token]
+
+
+def page_count(total, page_size):
+    return max(1, (total + page_size - 1) // page_size)
+
+
+def page_slice(ids, page, page_size):
+    page = max(0, min(page, page_count(len(ids), page_size) - 1))
+    start = page * page_size
+    return page, ids[start:start + page_size]
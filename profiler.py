@@ -0,0 +1,131 @@
+import cProfile
+import io
+import os
+import pstats
+import tempfile
+import threading
+import tracemalloc
+
+MAX_PROFILE_SECONDS = 120
+
+
+def _dump_to_bytes(dump):
+    """dump(path) пишет файл — возвращаем его содержимое"""
+    fd, path = tempfile.mkstemp()
+    os.close(fd)
+    try:
+        dump(path)
+        with open(path, 'rb') as f:
+            return f.read()
+    finally:
+        os.remove(path)
+
+
+class RequestProfiler:
+    """cProfile пути вебхук → ответ на ограниченное окно времени.
+
+    Пока профилирование выключено, вызывающий код проверяет только
+    атрибут enabled. Каждый запрос профилируется своим cProfile.Profile
+    (профиль нельзя включать в нескольких потоках сразу), результаты
+    суммируются в pstats.Stats.
+    """
+
+    def __init__(self):
+        self.enabled = False
+        self._lock = threading.Lock()
+        self._stats = None
+        self._requests = 0
+        self._on_done = None
+
+    def start(self, seconds, on_done):
+        """on_done(summary, filename, data) вызывается по окончании окна"""
+        with self._lock:
+            if self.enabled:
+                return False
+            self._stats = None
+            self._requests = 0
+            self._on_done = on_done
+            self.enabled = True
+        timer = threading.Timer(max(1, min(seconds, MAX_PROFILE_SECONDS)), self._finish)
+        timer.daemon = True
+        timer.start()
+        return True
+
+    def run(self, fn, *args, **kwargs):
+        profile = cProfile.Profile()
+        try:
+            return profile.runcall(fn, *args, **kwargs)
+        finally:
+            with self._lock:
+                if self.enabled:
+                    self._requests += 1
+                    if self._stats is None:
+                        self._stats = pstats.Stats(profile)
+                    else:
+                        self._stats.add(profile)
+
+    def _finish(self):
+        with self._lock:
+            self.enabled = False
+            stats, requests, on_done = self._stats, self._requests, self._on_done
+            self._stats = None
+
+        if stats is None:
+            on_done("Запросов за окно: 0", None, None)
+            return
+
+        out = io.StringIO()
+        stats.stream = out
+        stats.sort_stats('cumulative').print_stats(15)
+        summary = f"Запросов за окно: {requests}\n\n{_trim_stats(out.getvalue())}"
+        on_done(summary, 'profile.pstats', _dump_to_bytes(stats.dump_stats))
+
+
+class MemoryProfiler:
+    """tracemalloc на ограниченное окно: разница снимков до и после.
+
+    tracemalloc запускается только на время окна и сразу останавливается.
+    """
+
+    def __init__(self, frames=5):
+        self.frames = frames
+        self.enabled = False
+        self._lock = threading.Lock()
+
+    def start(self, seconds, on_done):
+        with self._lock:
+            if self.enabled or tracemalloc.is_tracing():
+                return False
+            self.enabled = True
+        tracemalloc.start(self.frames)
+        before = tracemalloc.take_snapshot()
+
+        def finish():
+            try:
+                after = tracemalloc.take_snapshot()
+                current, peak = tracemalloc.get_traced_memory()
+            finally:
+                tracemalloc.stop()
+                self.enabled = False
+
+            lines = [f"Сейчас: {current / 1024:.0f} КБ, пик: {peak / 1024:.0f} КБ", ""]
+            for stat in after.compare_to(before, 'lineno')[:15]:
+                frame = stat.traceback[0]
+                lines.append(
+                    f"{os.path.basename(frame.filename)}:{frame.lineno} "
+                    f"{stat.size_diff / 1024:+.1f} КБ ({stat.count_diff:+d})"
+                )
+            on_done("\n".join(lines), 'memory.snapshot', _dump_to_bytes(after.dump))
+
+        timer = threading.Timer(max(1, min(seconds, MAX_PROFILE_SECONDS)), finish)
+        timer.daemon = True
+        timer.start()
+        return True
+
+
+def _trim_stats(text, max_length=3000):
+    """Вывод pstats без шапки, в пределах лимита сообщения Telegram"""
+    start = text.find('ncalls')
+    if start != -1:
+        text = text[start:]
+    return text[:max_length]
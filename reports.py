@@ -0,0 +1,194 @@
+import io
+import multiprocessing
+import sys
+import threading
+import types
+from collections import OrderedDict
+from concurrent.futures import Future, ProcessPoolExecutor
+
+
+# ---------- Рендеринг (выполняется в отдельном процессе) ----------
+def _pyplot():
+    import matplotlib
+    matplotlib.use('Agg')
+    import matplotlib.pyplot as plt
+    return plt
+
+
+def _to_png(plt, fig):
+    buffer = io.BytesIO()
+    fig.savefig(buffer, format='png', dpi=120, bbox_inches='tight')
+    plt.close(fig)
+    return buffer.getvalue()
+
+
+def render_views_chart(title, days, views):
+    """Просмотры по дням публикации"""
+    plt = _pyplot()
+    fig, ax = plt.subplots(figsize=(8, 4))
+    ax.plot(days, views, marker='o', color='#4f46e5')
+    ax.fill_between(range(len(days)), views, alpha=0.15, color='#4f46e5')
+    ax.set_title(title)
+    ax.set_ylabel('Просмотры')
+    ax.grid(alpha=0.3)
+    fig.autofmt_xdate()
+    return _to_png(plt, fig)
+
+
+def render_reactions_chart(title, labels, counts):
+    """Распределение реакций"""
+    plt = _pyplot()
+    fig, ax = plt.subplots(figsize=(6, 4))
+    ax.bar(range(len(labels)), counts, color='#764ba2')
+    ax.set_xticks(range(len(labels)))
+    ax.set_xticklabels(labels)
+    ax.set_title(title)
+    ax.set_ylabel('Реакции')
+    ax.grid(axis='y', alpha=0.3)
+    return _to_png(plt, fig)
+
+
+def charts_available():
+    try:
+        import matplotlib  # noqa: F401
+        return True
+    except ImportError:
+        return False
+
+
+# ---------- Кэш и пул ----------
+_spawn_lock = threading.Lock()
+
+
+class _RenderProcess(multiprocessing.context.SpawnProcess):
+    """Процесс пула, который не импортирует главный модуль.
+
+    spawn передает ребенку путь или имя __main__, и тот заново выполняет
+    app.py как __mp_main__ — со всеми побочными эффектами уровня модуля
+    (бот, пулы, фоновые потоки). На время запуска __main__ подменяется
+    пустым модулем: воркеру нужен только reports.py, который он
+    импортирует сам при распаковке задачи.
+    """
+
+    @staticmethod
+    def _Popen(process_obj):
+        with _spawn_lock:
+            main = sys.modules['__main__']
+            sys.modules['__main__'] = types.ModuleType('__main__')
+            try:
+                return multiprocessing.context.SpawnProcess._Popen(process_obj)
+            finally:
+                sys.modules['__main__'] = main
+
+
+class _RenderContext(multiprocessing.context.SpawnContext):
+    Process = _RenderProcess
+
+
+class ReportCache:
+    """Готовые картинки по ключу (channel_id, вид, поколение данных).
+
+    Поколение канала увеличивается при каждой записи его постов, поэтому
+    устаревшие картинки просто перестают совпадать по ключу и вытесняются
+    по LRU. После первой отправки вместо PNG хранится file_id Telegram.
+    """
+
+    def __init__(self, max_entries=256):
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()  # key -> {'png': bytes|None, 'file_id': str|None}
+        self._generations = {}
+        self.counters = {'hits_file_id': 0, 'hits_png': 0, 'renders': 0}
+
+    def bump(self, channel_ids):
+        with self._lock:
+            for channel_id in channel_ids:
+                self._generations[channel_id] = self._generations.get(channel_id, 0) + 1
+
+    def generation(self, channel_id):
+        with self._lock:
+            return self._generations.get(channel_id, 0)
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                self._entries.move_to_end(key)
+                self.counters['hits_file_id' if entry['file_id'] else 'hits_png'] += 1
+            return entry
+
+    def put(self, key, png=None, file_id=None):
+        with self._lock:
+            entry = self._entries.setdefault(key, {'png': None, 'file_id': None})
+            if png is not None:
+                entry['png'] = png
+            if file_id is not None:
+                # PNG больше не нужен — Telegram отдаст картинку по file_id
+                entry['file_id'] = file_id
+                entry['png'] = None
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def stats(self):
+        with self._lock:
+            return {**self.counters, 'entries': len(self._entries)}
+
+
+class ReportRenderer:
+    """Рендеринг графиков в пуле процессов с кэшем и слиянием одинаковых задач"""
+
+    def __init__(self, cache, max_workers=2):
+        self.cache = cache
+        self.max_workers = max_workers
+        self._pool = None
+        self._lock = threading.Lock()
+        self._inflight = {}
+
+    def _executor(self):
+        if self._pool is None:
+            # spawn: дочерние процессы не наследуют потоки и соединения Flask/SQLite
+            self._pool = ProcessPoolExecutor(
+                max_workers=self.max_workers,
+                mp_context=_RenderContext()
+            )
+        return self._pool
+
+    def cached(self, key):
+        """Завершенный Future из кэша или None — до сбора данных для графика"""
+        entry = self.cache.get(key)
+        if entry is None:
+            return None
+        done = Future()
+        done.set_result(dict(entry))
+        return done
+
+    def render(self, key, fn, *args):
+        """Future с {'png': ..., 'file_id': ...}; из кэша — уже завершенный"""
+        done = self.cached(key)
+        if done is not None:
+            return done
+
+        with self._lock:
+            pending = self._inflight.get(key)
+            if pending is not None:
+                return pending
+
+            result = Future()
+            self._inflight[key] = result
+            self.cache.counters['renders'] += 1
+            job = self._executor().submit(fn, *args)
+
+        def finished(job):
+            with self._lock:
+                self._inflight.pop(key, None)
+            try:
+                png = job.result()
+            except Exception as e:
+                result.set_exception(e)
+                return
+            self.cache.put(key, png=png)
+            result.set_result({'png': png, 'file_id': None})
+
+        job.add_done_callback(finished)
+        return result
@@ -0,0 +1,352 @@
+import heapq
+import os
+import sqlite3
+import threading
+import time
+import zlib
+from concurrent.futures import ThreadPoolExecutor
+
+# Основная БД: пользователи, каналы и журнал команд
+MAIN_SCHEMA = (
+    '''
+    CREATE TABLE IF NOT EXISTS users (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        user_id INTEGER UNIQUE NOT NULL,
+        username TEXT,
+        first_name TEXT,
+        join_date INTEGER DEFAULT (CAST(strftime('%s', 'now') AS INTEGER)),
+        last_activity INTEGER
+    )
+    ''',
+    '''
+    CREATE TABLE IF NOT EXISTS channels (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        channel_id TEXT UNIQUE NOT NULL,
+        channel_name TEXT,
+        username TEXT,
+        added_date TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+        is_active BOOLEAN DEFAULT 1
+    )
+    ''',
+    '''
+    CREATE TABLE IF NOT EXISTS commands_log (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        user_id INTEGER,
+        command TEXT,
+        executed_at INTEGER DEFAULT (CAST(strftime('%s', 'now') AS INTEGER))
+    )
+    ''',
+    "CREATE INDEX IF NOT EXISTS idx_channels_active_added ON channels(is_active, added_date)",
+    "CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT)",
+)
+
+POST_COLUMNS = ('channel_id', 'post_id', 'message_text', 'views', 'forwards', 'reactions', 'post_date')
+
+POSTS_SCHEMA = '''
+    CREATE TABLE IF NOT EXISTS posts (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        channel_id TEXT NOT NULL,
+        post_id INTEGER NOT NULL,
+        message_text TEXT,
+        views INTEGER DEFAULT 0,
+        forwards INTEGER DEFAULT 0,
+        reactions TEXT DEFAULT '{}',
+        post_date INTEGER,
+        updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+        UNIQUE(channel_id, post_id)
+    )
+'''
+
+UPSERT_POST = '''
+    INSERT INTO posts (channel_id, post_id, message_text, views, forwards, reactions, post_date)
+    VALUES (?, ?, ?, ?, ?, ?, ?)
+    ON CONFLICT(channel_id, post_id) DO UPDATE SET
+        message_text = excluded.message_text,
+        views = excluded.views,
+        forwards = excluded.forwards,
+        reactions = excluded.reactions,
+        post_date = COALESCE(excluded.post_date, posts.post_date),
+        updated_at = CURRENT_TIMESTAMP
+'''
+
+UPSERT_POST_CONTENT = '''
+    INSERT INTO posts (channel_id, post_id, message_text, post_date)
+    VALUES (?, ?, ?, ?)
+    ON CONFLICT(channel_id, post_id) DO UPDATE SET
+        message_text = excluded.message_text,
+        post_date = COALESCE(posts.post_date, excluded.post_date),
+        updated_at = CURRENT_TIMESTAMP
+'''
+
+
+class ShardCountMismatch(RuntimeError):
+    """POST_SHARDS не совпадает с числом шардов, с которым создавалась БД"""
+
+
+def shard_paths(db_path, shard_count):
+    """Пути к файлам шардов рядом с основной БД: bot_database.posts-0.db, ..."""
+    root, ext = os.path.splitext(db_path)
+    return [f"{root}.posts-{i}{ext or '.db'}" for i in range(shard_count)]
+
+
+class ShardedPostStorage:
+    """Посты (и все, что привязано к посту) разложены по N файлам SQLite.
+
+    Шард выбирается по crc32(channel_id), поэтому все посты канала лежат
+    в одном файле. Запись в разные шарды идет параллельно, чтение —
+    scatter-gather по всем шардам с последующим слиянием.
+    """
+
+    def __init__(self, db_path, shard_count=4):
+        self.shard_count = max(1, int(shard_count))
+        self.paths = shard_paths(db_path, self.shard_count)
+        self._locks = [threading.Lock() for _ in range(self.shard_count)]
+        self._pool = ThreadPoolExecutor(max_workers=self.shard_count, thread_name_prefix='shard')
+
+    def shard_for(self, channel_id):
+        return zlib.crc32(str(channel_id).encode('utf-8')) % self.shard_count
+
+    def connect(self, shard):
+        conn = sqlite3.connect(self.paths[shard], timeout=30)
+        conn.row_factory = sqlite3.Row
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        return conn
+
+    def check_shard_count(self, conn):
+        """Число шардов записывается в meta основной БД при первом запуске.
+
+        От него зависит crc32(channel_id) % N: с другим N чтение идет не в
+        те файлы, а запись плодит дубли, поэтому при несовпадении — ошибка.
+        """
+        row = conn.execute("SELECT value FROM meta WHERE key = 'post_shards'").fetchone()
+        if row is None:
+            conn.execute("INSERT INTO meta (key, value) VALUES ('post_shards', ?)", (str(self.shard_count),))
+            conn.commit()
+        elif int(row[0]) != self.shard_count:
+            raise ShardCountMismatch(
+                f"БД создана с {row[0]} шардами постов, а POST_SHARDS={self.shard_count}; "
+                f"верните POST_SHARDS={row[0]}"
+            )
+
+    def init(self):
+        """Создание таблиц во всех шардах"""
+        for shard in range(self.shard_count):
+            conn = self.connect(shard)
+            conn.execute(POSTS_SCHEMA)
+            conn.execute("CREATE INDEX IF NOT EXISTS idx_posts_views ON posts(views DESC)")
+            conn.commit()
+            conn.close()
+
+    def _run(self, fn, shards):
+        """Выполнить fn(shard) для каждого шарда параллельно"""
+        shards = list(shards)
+        if len(shards) == 1:
+            return [fn(shards[0])]
+        return list(self._pool.map(fn, shards))
+
+    # ---------- Запись ----------
+    def _write(self, shard, sql, rows):
+        with self._locks[shard]:
+            conn = self.connect(shard)
+            try:
+                with conn:
+                    conn.executemany(sql, rows)
+            finally:
+                conn.close()
+        return len(rows)
+
+    def upsert_posts(self, posts):
+        """Пакетная запись постов: одна транзакция на шард, шарды пишутся параллельно.
+
+        posts — итерируемое из кортежей в порядке POST_COLUMNS.
+        """
+        by_shard = {}
+        for row in posts:
+            by_shard.setdefault(self.shard_for(row[0]), []).append(tuple(row))
+        if not by_shard:
+            return 0
+        written = self._run(lambda shard: self._write(shard, UPSERT_POST, by_shard[shard]), by_shard)
+        return sum(written)
+
+    def upsert_post_content(self, posts):
+        """Текст и дата поста без перезаписи метрик (channel_post из вебхука).
+
+        posts — кортежи (channel_id, post_id, message_text, post_date).
+        """
+        by_shard = {}
+        for row in posts:
+            by_shard.setdefault(self.shard_for(row[0]), []).append(tuple(row))
+        if not by_shard:
+            return 0
+        written = self._run(lambda shard: self._write(shard, UPSERT_POST_CONTENT, by_shard[shard]), by_shard)
+        return sum(written)
+
+    def import_from(self, conn):
+        """Перенос постов из старой таблицы posts основной БД в шарды"""
+        cursor = conn.execute(f"SELECT {', '.join(POST_COLUMNS)} FROM posts")
+        moved = 0
+        while True:
+            rows = cursor.fetchmany(5000)
+            if not rows:
+                break
+            moved += self.upsert_posts(tuple(row) for row in rows)
+        return moved
+
+    # ---------- Чтение ----------
+    def _query(self, shard, sql, params=()):
+        conn = self.connect(shard)
+        try:
+            return conn.execute(sql, params).fetchall()
+        finally:
+            conn.close()
+
+    def scatter(self, sql, params=()):
+        """Один и тот же запрос на всех шардах, результаты списком по шардам"""
+        return self._run(lambda shard: self._query(shard, sql, params), range(self.shard_count))
+
+    def totals(self):
+        """Общее число постов и сумма просмотров"""
+        posts, views = 0, 0
+        for rows in self.scatter("SELECT COUNT(*), COALESCE(SUM(views), 0) FROM posts"):
+            posts += rows[0][0]
+            views += rows[0][1]
+        return posts, views
+
+    def top_post_keys(self, limit):
+        """Ключи (channel_id, post_id) топа по просмотрам: top-N с каждого шарда и слияние"""
+        per_shard = self.scatter('''
+            SELECT channel_id, post_id, views
+            FROM posts
+            WHERE views > 0
+            ORDER BY views DESC
+            LIMIT ?
+        ''', (limit,))
+        top = heapq.nlargest(limit, (row for rows in per_shard for row in rows), key=lambda row: row['views'])
+        return [(row['channel_id'], row['post_id']) for row in top]
+
+    def get_posts(self, keys):
+        """{(channel_id, post_id): row} для заданных ключей.
+
+        OR из равенств — поиск по UNIQUE(channel_id, post_id) на каждый ключ;
+        (channel_id, post_id) IN (VALUES ...) SQLite выполняет сканированием.
+        """
+        by_shard = {}
+        for channel_id, post_id in keys:
+            by_shard.setdefault(self.shard_for(channel_id), []).append((channel_id, post_id))
+        if not by_shard:
+            return {}
+
+        def query(shard):
+            pairs = by_shard[shard]
+            params = [value for pair in pairs for value in pair]
+            return self._query(shard, f'''
+                SELECT channel_id, post_id, message_text, views, forwards, reactions, post_date
+                FROM posts
+                WHERE {' OR '.join(['(channel_id = ? AND post_id = ?)'] * len(pairs))}
+            ''', params)
+
+        return {
+            (row['channel_id'], row['post_id']): row
+            for rows in self._run(query, by_shard)
+            for row in rows
+        }
+
+    def channel_digest(self, channel_id, since, limit=3):
+        """(постов, просмотров, репостов) с since и лучшие посты за этот период.
+
+        Оба запроса — поиск диапазона по idx_posts_channel_date.
+        """
+        conn = self.connect(self.shard_for(channel_id))
+        try:
+            totals = conn.execute('''
+                SELECT COUNT(*), COALESCE(SUM(views), 0), COALESCE(SUM(forwards), 0)
+                FROM posts
+                WHERE channel_id = ? AND post_date >= ?
+            ''', (channel_id, since)).fetchone()
+            best = conn.execute('''
+                SELECT post_id, message_text, views
+                FROM posts
+                WHERE channel_id = ? AND post_date >= ?
+                ORDER BY views DESC
+                LIMIT ?
+            ''', (channel_id, since, limit)).fetchall()
+            return tuple(totals), best
+        finally:
+            conn.close()
+
+    def channel_views_by_bucket(self, channel_id, bounds):
+        """[(начало, просмотры)] по интервалам bounds, только интервалы с постами"""
+        if not bounds:
+            return []
+        values = ', '.join(['(?, ?)'] * len(bounds))
+        rows = self._query(self.shard_for(channel_id), f'''
+            WITH buckets(bucket_start, bucket_end) AS (VALUES {values})
+            SELECT bucket_start, COUNT(posts.post_id), COALESCE(SUM(posts.views), 0)
+            FROM buckets
+            JOIN posts ON posts.channel_id = ?
+                      AND posts.post_date >= bucket_start AND posts.post_date < bucket_end
+            GROUP BY bucket_start
+            ORDER BY bucket_start
+        ''', [value for bound in bounds for value in bound] + [channel_id])
+        return [(row[0], row[2]) for row in rows]
+
+    def channel_reactions(self, channel_id):
+        """{реакция: сумма} по всем постам канала — суммирует SQLite через json_each"""
+        rows = self._query(self.shard_for(channel_id), '''
+            SELECT reaction.key, SUM(reaction.value)
+            FROM posts, json_each(posts.reactions) AS reaction
+            WHERE posts.channel_id = ? AND json_valid(posts.reactions)
+            GROUP BY reaction.key
+        ''', (channel_id,))
+        return {row[0]: row[1] for row in rows}
+
+    def channel_totals(self, channel_ids):
+        """{channel_id: (posts_count, total_views)} — запрос только к нужным шардам"""
+        by_shard = {}
+        for channel_id in channel_ids:
+            by_shard.setdefault(self.shard_for(channel_id), []).append(channel_id)
+        if not by_shard:
+            return {}
+
+        def query(shard):
+            ids = by_shard[shard]
+            return self._query(shard, f'''
+                SELECT channel_id, COUNT(*), COALESCE(SUM(views), 0)
+                FROM posts
+                WHERE channel_id IN ({', '.join('?' * len(ids))})
+                GROUP BY channel_id
+            ''', ids)
+
+        totals = {}
+        for rows in self._run(query, by_shard):
+            for row in rows:
+                totals[row[0]] = (row[1], row[2])
+        return totals
+
+
+def benchmark(directory, shard_counts=(1, 4, 8), channels=400, posts_per_channel=250, batch=500):
+    """Пропускная способность записи (постов/сек) при разном числе шардов"""
+    results = {}
+    for shard_count in shard_counts:
+        storage = ShardedPostStorage(os.path.join(directory, f"bench_{shard_count}.db"), shard_count)
+        storage.init()
+        rows = [
+            (f"@channel_{c}", p, f"post {p}", p * 10, p, '{}', None)
+            for p in range(posts_per_channel)
+            for c in range(channels)
+        ]
+        started = time.perf_counter()
+        for i in range(0, len(rows), batch * shard_count):
+            storage.upsert_posts(rows[i:i + batch * shard_count])
+        elapsed = time.perf_counter() - started
+        results[shard_count] = len(rows) / elapsed
+    return results
+
+
+if __name__ == '__main__':
+    import tempfile
+
+    with tempfile.TemporaryDirectory() as tmp:
+        for shard_count, rate in benchmark(tmp).items():
+            print(f"{shard_count} шард(ов): {rate:,.0f} постов/сек")
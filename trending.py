@@ -0,0 +1,148 @@
+import heapq
+import math
+import threading
+import time
+
+TRENDING_SCHEMA = '''
+    CREATE TABLE IF NOT EXISTS trending_scores (
+        channel_id TEXT NOT NULL,
+        post_id INTEGER NOT NULL,
+        last_views INTEGER NOT NULL,
+        last_seen REAL NOT NULL,
+        score REAL NOT NULL,
+        PRIMARY KEY (channel_id, post_id)
+    )
+'''
+
+
+class TrendingTracker:
+    """Скорость набора просмотров постов (EWMA) с затуханием.
+
+    Счет обновляется при каждом обновлении метрик поста, поэтому запрос
+    /trending не сканирует историю. score — просмотров в секунду;
+    без новых данных он затухает с постоянной времени tau.
+    Хранится не больше capacity постов — при переполнении вытесняются
+    посты с наименьшим текущим счетом. Скорость считается только по
+    приросту просмотров между двумя замерами: после первого наблюдения
+    счет 0 и пост не попадает в top(). Чтобы при заполненном трекере он
+    не вытеснялся первым, не дождавшись второго замера, новые посты
+    grace секунд не вытесняются вовсе.
+    """
+
+    def __init__(self, capacity=10000, tau=3600.0, grace=900.0, clock=time.time):
+        self.capacity = capacity
+        self.tau = float(tau)
+        self.grace = float(grace)
+        self.clock = clock
+        self._lock = threading.Lock()
+        self._entries = {}  # (channel_id, post_id) -> [last_views, last_seen, score, first_seen]
+        self._dirty = False
+
+    def __len__(self):
+        return len(self._entries)
+
+    def _decayed(self, entry, now):
+        return entry[2] * math.exp(-max(0.0, now - entry[1]) / self.tau)
+
+    def observe(self, channel_id, post_id, views, now=None):
+        with self._lock:
+            self._observe((channel_id, post_id), views, self.clock() if now is None else now)
+
+    def observe_many(self, posts, now=None):
+        """posts — кортежи (channel_id, post_id, views, ...)"""
+        with self._lock:
+            now = self.clock() if now is None else now
+            for post in posts:
+                self._observe((post[0], post[1]), post[2], now)
+
+    def _observe(self, key, views, now):
+        views = views or 0
+        entry = self._entries.get(key)
+        if entry is None:
+            # Первое наблюдение — только точка отсчета
+            self._entries[key] = [views, now, 0.0, now]
+            self._dirty = True
+            if len(self._entries) > self.capacity:
+                self._evict(now)
+            return
+
+        dt = now - entry[1]
+        if dt <= 0:
+            entry[0] = max(entry[0], views)
+            return
+
+        velocity = max(0, views - entry[0]) / dt
+        alpha = 1.0 - math.exp(-dt / self.tau)
+        entry[2] = alpha * velocity + (1.0 - alpha) * entry[2]
+        entry[0] = views
+        entry[1] = now
+        self._dirty = True
+
+    def _evict(self, now):
+        """Оставить ~90% емкости: сначала посты моложе grace, затем с наибольшим счетом"""
+        keep = int(self.capacity * 0.9)
+        survivors = heapq.nlargest(keep, self._entries.items(), key=lambda item: (
+            now - item[1][3] < self.grace,
+            self._decayed(item[1], now),
+            item[1][1],
+        ))
+        self._entries = dict(survivors)
+
+    def top(self, limit=10, now=None):
+        """[(channel_id, post_id, score)] по убыванию текущего счета"""
+        with self._lock:
+            now = self.clock() if now is None else now
+            scored = (
+                (key[0], key[1], self._decayed(entry, now))
+                for key, entry in self._entries.items()
+            )
+            return [item for item in heapq.nlargest(limit, scored, key=lambda item: item[2]) if item[2] > 0]
+
+    # ---------- Сохранение ----------
+    def save(self, conn):
+        with self._lock:
+            if not self._dirty:
+                return False
+            rows = [(key[0], key[1], e[0], e[1], e[2]) for key, e in self._entries.items()]
+            self._dirty = False
+        try:
+            with conn:
+                conn.execute(TRENDING_SCHEMA)
+                conn.execute("DELETE FROM trending_scores")
+                conn.executemany("INSERT INTO trending_scores VALUES (?, ?, ?, ?, ?)", rows)
+        except Exception:
+            self._dirty = True
+            raise
+        return True
+
+    def load(self, conn):
+        conn.execute(TRENDING_SCHEMA)
+        rows = conn.execute('''
+            SELECT channel_id, post_id, last_views, last_seen, score
+            FROM trending_scores
+            ORDER BY score DESC
+            LIMIT ?
+        ''', (self.capacity,)).fetchall()
+        with self._lock:
+            self._entries = {(row[0], row[1]): [row[2], row[3], row[4], row[3]] for row in rows}
+            self._dirty = False
+        return len(rows)
+
+    def start_autosave(self, connect, interval=60, on_error=None):
+        """Фоновое сохранение раз в interval секунд (только при изменениях)"""
+        def loop():
+            while True:
+                time.sleep(interval)
+                try:
+                    conn = connect()
+                    try:
+                        self.save(conn)
+                    finally:
+                        conn.close()
+                except Exception as e:
+                    if on_error:
+                        on_error(e)
+
+        thread = threading.Thread(target=loop, name='trending-autosave', daemon=True)
+        thread.start()
+        return thread